@@ -5,10 +5,31 @@ DB helper с fallback'ом:
 - Иначе -> используем локальную SQLite базу в ./data/bot.db.
 Оборачиваем метод connection.cursor, чтобы он возвращал объект, поддерживающий
 контекстный менеджер (with ... as cur:).
+
+Помимо общего соединения get_conn() есть пул (pooled_conn()):
+- Postgres: psycopg2.pool.ThreadedConnectionPool (до DB_POOL_MAX соединений);
+- SQLite: очередь из до DB_POOL_MAX соединений к одному файлу (WAL) и отдельная очередь
+  read-only соединений (pooled_conn(readonly=True)): читатели в WAL не ждут писателя.
+Соединение из пула принадлежит одному потоку на время with-блока,
+поэтому явные транзакции разных потоков не перемешиваются.
 """
 
+import logging
 import os
+import queue
+import sqlite3
 import threading
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+# Ошибки драйверов БД — их и только их глушим в служебных местах (close/ROLLBACK/ANALYZE/интроспекция);
+# прочие исключения — баги, пусть всплывают
+try:
+    from psycopg2 import Error as _PgError
+except ImportError:
+    _PgError = sqlite3.Error
+DB_ERRORS = (sqlite3.Error, _PgError)
 
 _DATABASE_URL = os.getenv("DATABASE_URL", "").strip()
 _USE_PG = bool(_DATABASE_URL)
@@ -24,6 +45,33 @@ _pg_conn = None
 _sqlite_conn = None
 _lock = threading.Lock()
 
+# Пул соединений
+_POOL_MAX = max(1, int(os.getenv("DB_POOL_MAX", "8") or 8))
+_pg_pool = None
+_pg_pool_sem = threading.BoundedSemaphore(_POOL_MAX)  # ThreadedConnectionPool не ждёт, а бросает PoolError
+# SQLite: отдельные очереди для RW и RO соединений (ключ — readonly)
+_sqlite_pools = {False: queue.LifoQueue(), True: queue.LifoQueue()}
+_sqlite_pool_sizes = {False: 0, True: 0}
+
+# Ответ is_sqlite_conn кэшируем по классу соединения: на сам объект атрибут не повесить
+# (sqlite3.Connection и connection из psycopg2 — C-типы без __dict__).
+_IS_SQLITE_BY_CLS = {}
+
+
+def is_sqlite_conn(conn) -> bool:
+    """
+    SQLite или Postgres — по классу соединения (одна проверка на класс, дальше — поиск в dict).
+    """
+    cls = conn.__class__
+    v = _IS_SQLITE_BY_CLS.get(cls)
+    if v is not None:
+        return v
+    v = (getattr(cls, "__module__", None) or "").startswith("sqlite3")
+    if not v and not hasattr(conn, "closed") and hasattr(conn, "execute"):
+        v = True
+    _IS_SQLITE_BY_CLS[cls] = v
+    return v
+
 
 def _wrap_sqlite_cursor(conn):
     """
@@ -65,6 +113,48 @@ def _wrap_sqlite_cursor(conn):
         pass
 
 
+_sqlite_types_registered = False
+
+
+def _sqlite_types():
+    """
+    Адаптер Decimal -> str на уровне драйвера (один раз на процесс): запись Decimal без str()
+    в вызывающем коде. Конвертера на чтение нет: NUMERIC-колонки SQLite хранят REAL,
+    а конвертер получил бы 15-значную запись float от самого SQLite, а не записанное значение —
+    в Decimal приводим в params (_db_dec, float через str()).
+    Возвращает detect_types для sqlite3.connect.
+    """
+    global _sqlite_types_registered
+    import sqlite3
+    if not _sqlite_types_registered:
+        from decimal import Decimal
+        sqlite3.register_adapter(Decimal, str)
+        _sqlite_types_registered = True
+    return 0
+
+
+# PRAGMA на каждое новое SQLite-соединение (действуют в пределах соединения,
+# кроме journal_mode — он хранится в файле БД):
+# - WAL: читатели не блокируют писателя при нескольких соединениях к одному файлу;
+# - synchronous=NORMAL в WAL — fsync только на checkpoint, а не на каждый COMMIT;
+# - временные структуры (сортировки, UNION) — в памяти; mmap и кэш страниц побольше.
+_SQLITE_PRAGMAS = (
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",  # 256 MiB
+    "PRAGMA cache_size=-20000",    # ~20 MiB
+)
+
+
+def _tune_sqlite(conn, readonly: bool = False):
+    """Один раз при открытии соединения; ошибки PRAGMA не мешают работе."""
+    for sql in (_SQLITE_PRAGMAS if readonly else ("PRAGMA journal_mode=WAL",) + _SQLITE_PRAGMAS):
+        try:
+            conn.execute(sql)
+        except Exception:
+            pass
+
+
 def get_conn():
     """
     Возвращает соединение:
@@ -96,7 +186,9 @@ def get_conn():
 
     import sqlite3
     # isolation_level=None -> autocommit mode
-    conn = sqlite3.connect(_SQLITE_PATH, isolation_level=None, check_same_thread=False)
+    conn = sqlite3.connect(_SQLITE_PATH, isolation_level=None, check_same_thread=False,
+                           detect_types=_sqlite_types())
+    _tune_sqlite(conn)
     # row_factory оставляем дефолтным; важно — conn.cursor() вернётся обёрнутый
     _sqlite_conn = conn
     # применяем обёртку сразу
@@ -180,3 +272,134 @@ def init_db():
         cur.close()
     except Exception:
         pass
+
+
+# ========== Пул соединений ==========
+
+def _new_sqlite_conn():
+    import sqlite3
+    # isolation_level=None -> autocommit, как у общего соединения
+    conn = sqlite3.connect(_SQLITE_PATH, isolation_level=None, check_same_thread=False,
+                           detect_types=_sqlite_types())
+    _tune_sqlite(conn)
+    _wrap_sqlite_cursor(conn)
+    return conn
+
+
+def _new_sqlite_ro_conn():
+    import sqlite3
+    from urllib.request import pathname2url
+    try:
+        conn = sqlite3.connect("file:" + pathname2url(_SQLITE_PATH) + "?mode=ro", uri=True,
+                               isolation_level=None, check_same_thread=False,
+                               detect_types=_sqlite_types())
+        conn.execute("PRAGMA query_only=1")
+        _tune_sqlite(conn, readonly=True)
+    except Exception:
+        # файла ещё нет (до init_db) и т.п. — обычное соединение
+        return _new_sqlite_conn()
+    _wrap_sqlite_cursor(conn)
+    return conn
+
+
+def _get_pg_pool():
+    global _pg_pool
+    if _pg_pool is not None:
+        return _pg_pool
+    with _lock:
+        if _pg_pool is None:
+            try:
+                from psycopg2.pool import ThreadedConnectionPool
+            except Exception as e:
+                raise RuntimeError("psycopg2 required for DATABASE_URL usage but not installed: " + str(e))
+            _pg_pool = ThreadedConnectionPool(1, _POOL_MAX, _DATABASE_URL, sslmode="require")
+    return _pg_pool
+
+
+def acquire_conn(readonly: bool = False):
+    """
+    Берёт соединение из пула (ждёт, если все заняты). Вернуть — release_conn(conn, readonly).
+    readonly=True — SQLite-соединение только для чтения; в Postgres пул общий.
+    """
+    if _USE_PG:
+        _pg_pool_sem.acquire()
+        try:
+            pool = _get_pg_pool()
+            conn = pool.getconn()
+            if getattr(conn, "closed", False):
+                pool.putconn(conn, close=True)
+                conn = pool.getconn()
+            conn.autocommit = True
+            return conn
+        except Exception:
+            _pg_pool_sem.release()
+            raise
+
+    q = _sqlite_pools[readonly]
+    try:
+        return q.get_nowait()
+    except queue.Empty:
+        pass
+    with _lock:
+        can_create = _sqlite_pool_sizes[readonly] < _POOL_MAX
+        if can_create:
+            _sqlite_pool_sizes[readonly] += 1
+    if can_create:
+        try:
+            return _new_sqlite_ro_conn() if readonly else _new_sqlite_conn()
+        except Exception:
+            with _lock:
+                _sqlite_pool_sizes[readonly] -= 1
+            raise
+    return q.get()
+
+
+def release_conn(conn, readonly: bool = False) -> None:
+    """Возвращает соединение в пул."""
+    if _USE_PG:
+        try:
+            _get_pg_pool().putconn(conn, close=bool(getattr(conn, "closed", False)))
+        finally:
+            _pg_pool_sem.release()
+        return
+    _sqlite_pools[readonly].put(conn)
+
+
+@contextmanager
+def pooled_conn(readonly: bool = False):
+    """
+    with pooled_conn() as conn: ... — соединение из пула на время блока.
+    """
+    conn = acquire_conn(readonly)
+    try:
+        yield conn
+    finally:
+        release_conn(conn, readonly)
+
+
+@contextmanager
+def closing_cursor(conn):
+    """
+    with closing_cursor(conn) as cur: ... — курсор закрывается на выходе.
+    В отличие от contextlib.closing, ошибка close() не подменяет исключение из тела блока.
+    """
+    cur = conn.cursor()
+    try:
+        yield cur
+    finally:
+        try:
+            cur.close()
+        except DB_ERRORS as e:
+            log.debug("cursor close failed: %r", e)
+
+
+def query(conn, sql: str, params=()) -> list:
+    """
+    Строки одного SELECT. SQLite — conn.execute(): без явного создания/закрытия курсора;
+    Postgres — обычный курсор через closing_cursor.
+    """
+    if is_sqlite_conn(conn):
+        return conn.execute(sql, params).fetchall()
+    with closing_cursor(conn) as cur:
+        cur.execute(sql, params)
+        return cur.fetchall()
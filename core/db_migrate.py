@@ -1,6 +1,7 @@
 # core/db_migrate.py
 from __future__ import annotations
 import os
+import sqlite3
 from typing import Any
 from core.db import get_conn
 
@@ -14,6 +15,10 @@ def _sqlite_has_column(conn: Any, table: str, column: str) -> bool:
     cur = None
     try:
         cur = conn.cursor()
+        if sqlite3.sqlite_version_info >= (3, 16, 0):
+            # табличная функция pragma_table_info: поиск колонки — на стороне SQLite
+            cur.execute("SELECT 1 FROM pragma_table_info(?) WHERE name = ? LIMIT 1", (table, column))
+            return cur.fetchone() is not None
         cur.execute(f"PRAGMA table_info({table})")
         cols = [row[1] for row in cur.fetchall()]
         return column in cols
@@ -64,6 +69,45 @@ def _pg_add_exchange(conn: Any) -> None:
          WHERE exchange IS NULL OR exchange='';
     """)
 
+# ---------- Версия схемы ----------
+# Номер схемы храним в bot_runtime: после успешного run_all() — SCHEMA_VERSION,
+# и на следующих стартах миграции (ALTER + полный UPDATE-бэкфилл) не выполняются.
+SCHEMA_VERSION = 2  # 2 = bot_pairs.exchange + индекс (LOWER(exchange), pair)
+_SCHEMA_VERSION_KEY = "schema_version"
+
+def _get_schema_version(conn: Any) -> int:
+    ph = "%s" if _is_pg(conn) else "?"
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(f"SELECT value FROM bot_runtime WHERE key={ph}", (_SCHEMA_VERSION_KEY,))
+        row = cur.fetchone()
+        return int(row[0]) if row else 0
+    except Exception:
+        # нет таблицы/мусор в значении — считаем схему старой, миграции идемпотентны
+        return 0
+    finally:
+        try:
+            cur and cur.close()
+        except Exception:
+            pass
+
+def _set_schema_version(conn: Any, version: int) -> None:
+    if _is_pg(conn):
+        sql = ("INSERT INTO bot_runtime(key, value) VALUES (%s, %s) "
+               "ON CONFLICT (key) DO UPDATE SET value = EXCLUDED.value")
+    else:
+        sql = "INSERT OR REPLACE INTO bot_runtime(key, value) VALUES (?, ?)"
+    cur = None
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, (_SCHEMA_VERSION_KEY, str(version)))
+    finally:
+        try:
+            cur and cur.close()
+        except Exception:
+            pass
+
 # ---------- Public API ----------
 
 def migrate_to_v073_add_exchange() -> None:
@@ -76,6 +120,31 @@ def migrate_to_v073_add_exchange() -> None:
     else:
         _sqlite_add_exchange(conn)
 
+def migrate_add_pair_exchange_index() -> None:
+    """
+    Индекс (LOWER(exchange), pair) под delete_pair: WHERE pair = ? AND LOWER(exchange)=LOWER(?).
+    Выражения в индексах понимают и SQLite (>= 3.9), и Postgres. Идемпотентно.
+    """
+    conn = get_conn()
+    sql = "CREATE INDEX IF NOT EXISTS idx_bot_pairs_lower_ex_pair ON bot_pairs (LOWER(exchange), pair)"
+    if _is_pg(conn):
+        _pg_exec(conn, sql)
+    else:
+        _sqlite_exec(conn, sql)
+
 def run_all() -> None:
     """ Точка входа для всех миграций этой ветки. """
-    migrate_to_v073_add_exchange()
+    conn = get_conn()
+    done = False
+    try:
+        if _get_schema_version(conn) < SCHEMA_VERSION:
+            migrate_to_v073_add_exchange()
+            # после exchange: индекс ссылается на колонку
+            migrate_add_pair_exchange_index()
+            _set_schema_version(conn, SCHEMA_VERSION)
+        done = True
+    finally:
+        # схема могла измениться (в т.ч. соседним процессом) — сбросим кэш колонок
+        # при любом исходе; импорт здесь: core.params тянет много модулей
+        from core.params import invalidate_schema_cache
+        invalidate_schema_cache(migrated=done)
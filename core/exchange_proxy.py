@@ -15,6 +15,7 @@ _registry: Dict[str, Callable[[Any], ExchangeAdapter]] = {}
 _instances: Dict[str, ExchangeAdapter] = {}
 _config_ctx: Any | None = None
 _defaults_registered: bool = False
+_codes: frozenset[str] | None = None  # кэш ключей _registry; сбрасывает register_adapter
 
 
 class ExchangeNotRegistered(RuntimeError):
@@ -26,7 +27,9 @@ def register_adapter(code: str, factory: Callable[[Any], ExchangeAdapter]) -> No
     Регистрирует фабрику адаптера. Фабрика должна принимать единый config-контекст.
     Повторная регистрация перезапишет фабрику.
     """
+    global _codes
     _registry[code.strip().lower()] = factory
+    _codes = None
 
 
 def _register_defaults_once() -> None:
@@ -170,6 +173,18 @@ def available_exchanges() -> List[str]:
     _register_defaults_once()
     return sorted(_registry.keys())
 
+def available_exchange_set() -> frozenset[str]:
+    """
+    То же, что available_exchanges(), но множеством и без пересборки на каждый вызов
+    (для проверок «код биржи допустим»).
+    """
+    global _codes
+    codes = _codes
+    if codes is None:
+        _register_defaults_once()
+        codes = _codes = frozenset(_registry)
+    return codes
+
 def clear_cached_instances() -> None:
     """
     Сбросить кэш инстансов (удобно при hot-reload в дев-режиме).
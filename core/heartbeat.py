@@ -2,11 +2,10 @@
 from __future__ import annotations
 import time
 import threading
-from datetime import datetime, timezone
 from typing import Optional
 
-from core.db import get_conn
-from core.params import get_paused, list_pairs
+from core.db import pooled_conn, closing_cursor, query as _query, is_sqlite_conn as _is_sqlite_conn
+from core.params import get_paused, active_pair_count
 from core.telemetry import send_event
 
 # Ключи в bot_runtime
@@ -18,46 +17,37 @@ RT_LAST_FAST_PING  = "hb_last_fast_ping"   # быстрый пинг (кажды
 HEARTBEAT_EVERY_SEC = 60 * 60              # раз в 60 минут отправлять heartbeat в TG
 SILENCE_ALERT_SEC   = int(1.5 * 60 * 60)   # если тишина > 90 минут — шлём алерт при старте
 
+# Fast-ping в БД сбрасываем не чаще раза в FAST_PING_FLUSH_SEC (между сбросами — только в памяти).
+# Админка живёт в другом процессе и видит только БД, поэтому окно «alive» учитывает задержку сброса.
+FAST_PING_FLUSH_SEC = 30
+FAST_PING_ALIVE_SEC = FAST_PING_FLUSH_SEC + 15  # сброс + 3 * 5 сек
+
 # Фоновый поток fast-ping’а
 _fast_ping_thread: Optional[threading.Thread] = None
 _fast_ping_interval_sec: int = 5  # по умолчанию 5 сек
-
-
-def _is_sqlite_conn(conn) -> bool:
-    try:
-        return conn.__class__.__module__.startswith("sqlite3")
-    except Exception:
-        return (not hasattr(conn, "closed")) and hasattr(conn, "execute")
+_last_fast_ping_mem: int = 0      # последний пинг этого процесса (в памяти)
+_last_fast_ping_flush: int = 0    # когда последний раз писали RT_LAST_FAST_PING в БД
 
 
 def _rt_get(key: str) -> Optional[int]:
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        cur.execute(
+    with pooled_conn(readonly=True) as conn:
+        rows = _query(
+            conn,
             "SELECT value FROM bot_runtime WHERE key=%s;" if not _is_sqlite_conn(conn)
             else "SELECT value FROM bot_runtime WHERE key=?;",
             (key,)
         )
-        row = cur.fetchone()
-        if not row:
-            return None
-        v = row[0] if isinstance(row, (list, tuple)) else row
-        try:
-            return int(str(v))
-        except Exception:
-            return None
-    finally:
-        try: cur.close()
-        except Exception: pass
+    if not rows:
+        return None
+    try:
+        return int(str(rows[0][0]))
+    except Exception:
+        return None
 
 
 def _rt_set(key: str, value: int) -> None:
-    conn = get_conn()
-    is_sqlite = _is_sqlite_conn(conn)
-    cur = conn.cursor()
-    try:
-        if is_sqlite:
+    with pooled_conn() as conn, closing_cursor(conn) as cur:
+        if _is_sqlite_conn(conn):
             cur.execute(
                 "INSERT OR REPLACE INTO bot_runtime(key, value, updated_at) "
                 "VALUES (?, ?, CURRENT_TIMESTAMP)",
@@ -69,20 +59,23 @@ def _rt_set(key: str, value: int) -> None:
                 "ON CONFLICT (key) DO UPDATE SET value=EXCLUDED.value, updated_at=now()",
                 (key, str(int(value)))
             )
-    finally:
-        try: cur.close()
-        except Exception: pass
 
 
 def _fmt_ts(ts: int) -> str:
-    return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
+    # gmtime + %-форматирование: без объекта datetime и разбора шаблона strftime
+    t = time.gmtime(ts)
+    return "%04d-%02d-%02d %02d:%02d:%02d UTC" % (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
 
 
 def _fast_ping_once(ts: Optional[int] = None) -> None:
-    """Одноразовый быстрый пинг для веб-админки."""
+    """Одноразовый быстрый пинг для веб-админки (в БД — не чаще FAST_PING_FLUSH_SEC)."""
+    global _last_fast_ping_mem, _last_fast_ping_flush
     if ts is None:
         ts = int(time.time())
-    _rt_set(RT_LAST_FAST_PING, ts)
+    _last_fast_ping_mem = ts
+    if ts - _last_fast_ping_flush >= FAST_PING_FLUSH_SEC:
+        _rt_set(RT_LAST_FAST_PING, ts)
+        _last_fast_ping_flush = ts
 
 
 def start_fast_ping_loop(interval_sec: int = 5) -> None:
@@ -110,8 +103,14 @@ def start_fast_ping_loop(interval_sec: int = 5) -> None:
 
 
 def get_last_ping_ts() -> Optional[int]:
-    """Для веб-админки: последнее значение RT_LAST_FAST_PING (сек, UTC)."""
-    return _rt_get(RT_LAST_FAST_PING)
+    """
+    Для веб-админки: последнее значение RT_LAST_FAST_PING (сек, UTC).
+    Если пингует этот же процесс — свежее значение берётся из памяти.
+    """
+    db_ts = _rt_get(RT_LAST_FAST_PING)
+    if _last_fast_ping_mem and (db_ts is None or _last_fast_ping_mem > db_ts):
+        return _last_fast_ping_mem
+    return db_ts
 
 
 def init(ping_interval_sec: int = 5):
@@ -123,18 +122,20 @@ def init(ping_interval_sec: int = 5):
     4) Запускает fast-ping петлю для статуса админки.
     """
     now = int(time.time())
+    # Статус нужен и алерту, и стартовому heartbeat — читаем один раз
+    paused = get_paused()
+    pairs_count = active_pair_count()
+
     last_tick = _rt_get(RT_LAST_TICK)
     if last_tick is not None:
         gap = now - last_tick
         if gap > SILENCE_ALERT_SEC:
-            paused = get_paused()
-            pairs = list_pairs(include_disabled=False)
             msg = (
                 f"<b>Долгая тишина обнаружена</b>\n"
                 f"• Последняя активность: { _fmt_ts(last_tick) }\n"
                 f"• Длительность простоя: {gap//60} мин\n"
                 f"• Пауза: {'да' if paused else 'нет'}\n"
-                f"• Активных пар: {len(pairs)}"
+                f"• Активных пар: {pairs_count}"
             )
             send_event("alert_silence", msg)
 
@@ -142,13 +143,11 @@ def init(ping_interval_sec: int = 5):
     _rt_set(RT_LAST_TICK, now)
 
     # Стартовый heartbeat в TG — чтобы пришло сразу после запуска
-    paused = get_paused()
-    pairs = list_pairs(include_disabled=False)
     start_msg = (
         f"<b>Heartbeat (startup)</b>\n"
         f"• Время: { _fmt_ts(now) }\n"
         f"• Пауза: {'да' if paused else 'нет'}\n"
-        f"• Активных пар: {len(pairs)}"
+        f"• Активных пар: {pairs_count}"
     )
     send_event("heartbeat", start_msg)
     _rt_set(RT_LAST_PING_SENT, now)
@@ -170,12 +169,11 @@ def tick():
     last_sent = _rt_get(RT_LAST_PING_SENT) or 0
     if now - last_sent >= HEARTBEAT_EVERY_SEC:
         paused = get_paused()
-        pairs = list_pairs(include_disabled=False)
         msg = (
             f"<b>Heartbeat</b>\n"
             f"• Время: { _fmt_ts(now) }\n"
             f"• Пауза: {'да' if paused else 'нет'}\n"
-            f"• Активных пар: {len(pairs)}"
+            f"• Активных пар: {active_pair_count()}"
         )
         send_event("heartbeat", msg)
         _rt_set(RT_LAST_PING_SENT, now)
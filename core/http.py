@@ -1,3 +1,4 @@
+import json
 import time
 import requests
 from urllib.parse import urlencode
@@ -5,6 +6,21 @@ from typing import Dict, Any, Optional
 from config import HOST, REQ_TIMEOUT, RETRIES, API_KEY
 from .signing import headers_signed
 
+# orjson — в разы быстрее на больших ответах (напр. my_trades); не установлен — stdlib json
+try:
+    import orjson as _orjson
+except ImportError:
+    _orjson = None
+
+def _json_loads(raw: bytes):
+    if _orjson is not None:
+        try:
+            return _orjson.loads(raw)
+        except _orjson.JSONDecodeError:
+            # orjson не принимает целые шире 64 бит (id и т.п.) — такие ответы разбирает stdlib
+            pass
+    return json.loads(raw)
+
 # Глобальная сессия с пулом соединений (keep-alive)
 SESSION = requests.Session()
 # Поднимем лимиты пула, чтобы параллельные запросы не ждали
@@ -40,8 +56,8 @@ def request(method: str,
                                        timeout=REQ_TIMEOUT)
 
             if 200 <= resp.status_code < 300:
-                txt = resp.text.strip()
-                return resp.json() if txt else None
+                raw = resp.content
+                return _json_loads(raw) if raw.strip() else None
 
             try:
                 info = resp.json()
@@ -52,15 +52,14 @@ def _save_pairs_json(items: List[PairEntry]) -> None:
         json.dump([asdict(x) for x in items], f, ensure_ascii=False, indent=2)
 
 
-def _validate_exchanges(items: List[PairEntry]) -> List[PairEntry]:
+def _validate_and_dedupe(items: List[PairEntry]) -> List[PairEntry]:
+    """Один проход: отбрасываем незарегистрированные биржи и дубликаты (exchange, pair)."""
     allowed = set(exchange_proxy.available_exchanges())
-    return [x for x in items if x.exchange in allowed]
-
-
-def _dedupe(items: List[PairEntry]) -> List[PairEntry]:
     seen = set()
     out: List[PairEntry] = []
     for x in items:
+        if x.exchange not in allowed:
+            continue
         k = x.key()
         if k in seen:
             continue
@@ -86,8 +85,7 @@ def list_pairs() -> List[Dict[str, Any]]:
         pr = (PAIR or "").strip().upper()
         items = [PairEntry(exchange="gate", pair=pr)] if pr else []
 
-    items = _validate_exchanges(items)
-    items = _dedupe(items)
+    items = _validate_and_dedupe(items)
     return [asdict(x) for x in items]
 
 
@@ -114,7 +112,6 @@ def upsert_pairs(new_pairs: List[Dict[str, Any]]) -> None:
             continue
         items.append(PairEntry(exchange=ex, pair=pr))
 
-    items = _validate_exchanges(items)
-    items = _dedupe(items)
+    items = _validate_and_dedupe(items)
 
     _save_pairs_json(items)
@@ -1,15 +1,19 @@
 # core/param_store.py
 from decimal import Decimal
-from threading import RLock
-from typing import Dict, Any
+from threading import Lock
+from types import MappingProxyType
+from typing import Dict, Any, Mapping
 
 from config import (
     PAIR, DEVIATION_PCT, QUOTE_USDT, LOT_SIZE_BASE,
     GAP_MODE, GAP_SWITCH_PCT, ACCOUNT_TYPE
 )
 
-_lock = RLock()
-_state: Dict[str, Any] = {
+# Запись — под локом (писатели редки); чтение — без лока.
+# _state никогда не мутируется на месте: update_params собирает новый dict
+# и подменяет ссылку целиком (присваивание атомарно под GIL).
+_lock = Lock()
+_state: Mapping[str, Any] = MappingProxyType({
     # стартовые значения — из config.py (как раньше)
     "PAIR": PAIR,
     "DEVIATION_PCT": Decimal(DEVIATION_PCT),
@@ -19,11 +23,30 @@ _state: Dict[str, Any] = {
     "GAP_SWITCH_PCT": Decimal(GAP_SWITCH_PCT),
     "ACCOUNT": ACCOUNT_TYPE or "spot",
     # при необходимости сюда же можно добавить другие параметры
+})
+
+def _to_decimal(v: Any) -> Decimal:
+    # Decimal/int — без лишнего круга через str(); остальное (str/float) — как раньше
+    if isinstance(v, Decimal):
+        return v
+    if type(v) is int:
+        return Decimal(v)
+    return Decimal(str(v))
+
+# Конвертеры по ключу; ключи без конвертера сохраняются как есть
+_CONV = {
+    "DEVIATION_PCT": _to_decimal,
+    "QUOTE": _to_decimal,
+    "LOT_SIZE_BASE": _to_decimal,
+    "GAP_SWITCH_PCT": _to_decimal,
+    "PAIR": str,
+    "GAP_MODE": str,
+    "ACCOUNT": str,
 }
 
 def get_params() -> Dict[str, Any]:
-    with _lock:
-        return dict(_state)
+    # Снимок неизменяем — копия берётся без лока
+    return dict(_state)
 
 def update_params(patch: Dict[str, Any]) -> Dict[str, Any]:
     """
@@ -31,17 +54,19 @@ def update_params(patch: Dict[str, Any]) -> Dict[str, Any]:
     Безопасно приводит к типам, игнорирует неизвестные ключи.
     Возвращает актуальное состояние после обновления.
     """
+    global _state
     with _lock:
+        new_state = dict(_state)
         for k, v in (patch or {}).items():
-            if k not in _state:
+            if k not in new_state:
+                continue
+            conv = _CONV.get(k)
+            if conv is None:
+                new_state[k] = v
+                continue
+            try:
+                new_state[k] = conv(v)
+            except Exception:
                 continue
-            if k in ("DEVIATION_PCT", "QUOTE", "LOT_SIZE_BASE", "GAP_SWITCH_PCT"):
-                try:
-                    _state[k] = Decimal(str(v))
-                except Exception:
-                    continue
-            elif k in ("PAIR", "GAP_MODE", "ACCOUNT"):
-                _state[k] = str(v)
-            else:
-                _state[k] = v
-        return dict(_state)
+        _state = MappingProxyType(new_state)
+        return dict(new_state)
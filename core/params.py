@@ -1,14 +1,58 @@
 # core/params.py
-from decimal import Decimal
-from typing import Dict, Any, List, TypedDict, Literal, Tuple
+import logging
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from decimal import Decimal, Context, ROUND_HALF_EVEN
+from typing import Dict, Any, Iterator, List, TypedDict, Literal, Tuple
 from config import (
     PAIR, DEVIATION_PCT, QUOTE_USDT, LOT_SIZE_BASE, GAP_MODE, GAP_SWITCH_PCT,
 )
-from .db import get_conn, init_db
-from core.exchange_proxy import available_exchanges
+from .db import (
+    init_db, pooled_conn, is_sqlite_conn as _is_sqlite_conn,
+    closing_cursor as _cursor, query as _query, DB_ERRORS as _DB_ERRORS,
+)
+from core.exchange_proxy import available_exchange_set
+
+log = logging.getLogger(__name__)
+
+try:
+    from psycopg2.extras import execute_values
+except ImportError:
+    # без psycopg2 — только SQLite, PG-ветки недостижимы
+    execute_values = None
 
 GapMode = Literal["off", "down_only", "symmetric"]
 
+# Контекст для числовых полей пар: точность = точности колонок bot_pairs (numeric(36, ...)),
+# чтобы не хранить в памяти разрядов больше, чем сохранит БД. Меньше (напр. 12) брать нельзя —
+# округлились бы реальные лоты/квоты из админки.
+_PAIR_CTX = Context(prec=36, rounding=ROUND_HALF_EVEN)
+
+# Типы, которые create_decimal принимает как есть (без str()). Строки — через конструктор Decimal:
+# create_decimal не принимает пробелы по краям и '_' между цифрами (" 0.5", "1_000"), а Decimal() — да.
+# float — только через str(), иначе получим двоичный хвост 0.1 -> 0.1000000000000000055...
+_DEC_DIRECT = frozenset((Decimal, int))
+
+_DEC_ZERO = Decimal("0")
+_DEC_ONE = Decimal("1")
+
+def _pair_dec(v: Any, default: Decimal = _DEC_ZERO) -> Decimal:
+    if v is None:
+        return default
+    t = type(v)
+    if t is str:
+        v = Decimal(v)
+    elif t not in _DEC_DIRECT:
+        v = Decimal(str(v))
+    return _PAIR_CTX.create_decimal(v)
+
+# Формат пары: BASE_QUOTE (после upper) — одна проверка регуляркой вместо ручных условий
+_PAIR_RE = re.compile(r"[A-Z0-9]+_[A-Z0-9]+")
+
 class PairCfg(TypedDict, total=False):
     idx: int
     pair: str
@@ -32,53 +76,246 @@ ALLOWED_KEYS = {
     "REPORT_INTERVAL": str,  # "hourly" | "30m" | "15m" | "5m"
 }
 
-def _coerce(k: str, v: str):
-    t = ALLOWED_KEYS.get(k)
-    if t is Decimal:
-        return Decimal(v)
-    if t is str:
-        return str(v)
-    return v
+def _to_storage(k: str, raw) -> str:
+    """
+    Значение для bot_settings.value: Decimal-ключи — через Decimal (валидация + каноничная запись),
+    без лишних str()/Decimal(), если raw уже Decimal/str.
+    """
+    if ALLOWED_KEYS.get(k) is Decimal:
+        return str(raw if type(raw) is Decimal else Decimal(raw if type(raw) is str else str(raw)))
+    return raw if type(raw) is str else str(raw)
+
+# Конвертеры значений bot_settings по ключу (без повторного разбора типа на каждой строке)
+_CONVERTERS = {k: (Decimal if t is Decimal else str) for k, t in ALLOWED_KEYS.items()}
+
+# ========== Реестр SQL ==========
+# Все запросы собираются один раз при импорте: ключ (диалект, есть ли bot_pairs.exchange) -> {имя: SQL}.
+# В функциях — только поиск по реестру, без ветвлений по диалекту на каждый вызов;
+# одинаковый текст запроса — попадание в кэш подготовленных выражений драйвера.
+_PAIR_BASE_COLS = "idx, pair, deviation_pct, quote, lot_size_base, gap_mode, gap_switch_pct, enabled"
+
+def _build_sql_variants() -> Dict[Tuple[str, bool], Dict[str, str]]:
+    out: Dict[Tuple[str, bool], Dict[str, str]] = {}
+    for dialect in ("sqlite", "pg"):
+        sqlite = dialect == "sqlite"
+        ph = "?" if sqlite else "%s"
+        enabled_true = "1" if sqlite else "TRUE"
+        if sqlite:
+            set_runtime = "INSERT OR REPLACE INTO bot_runtime(key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)"
+            # без execute_values: многострочный VALUES под число ключей — см. _SQLITE_UPSERT_SETTINGS_N
+            upsert_settings = "INSERT OR REPLACE INTO bot_settings(key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)"
+            # SELECT только разрешённых ключей: фильтр уходит в БД, лишние строки не тянем
+            load_overrides = "SELECT key, value FROM bot_settings WHERE key IN (" + ",".join("?" * len(ALLOWED_KEYS)) + ");"
+            # флаги paused/shutdown + настройки одним запросом (см. load_state)
+            load_state = (
+                "SELECT 'r', key, value FROM bot_runtime WHERE key IN (?, ?) "
+                "UNION ALL SELECT 's', key, value FROM bot_settings WHERE key IN ("
+                + ",".join("?" * len(ALLOWED_KEYS)) + ");"
+            )
+        else:
+            set_runtime = ("INSERT INTO bot_runtime(key, value) VALUES (%s, %s) "
+                           "ON CONFLICT (key) DO UPDATE SET value=EXCLUDED.value, updated_at=now()")
+            # execute_values: один %s под весь VALUES
+            upsert_settings = ("INSERT INTO bot_settings(key, value) VALUES %s "
+                               "ON CONFLICT (key) DO UPDATE SET value=EXCLUDED.value, updated_at=now()")
+            load_overrides = "SELECT key, value FROM bot_settings WHERE key = ANY(%s);"
+            load_state = (
+                "SELECT 'r', key, value FROM bot_runtime WHERE key = ANY(%s) "
+                "UNION ALL SELECT 's', key, value FROM bot_settings WHERE key = ANY(%s);"
+            )
+        for has_ex in (True, False):
+            cols = _PAIR_BASE_COLS + (", exchange" if has_ex else "")
+            n_cols = cols.count(",") + 1
+            upsert_set = (
+                " ON CONFLICT (idx) DO UPDATE SET "
+                + ", ".join(f"{c}=EXCLUDED.{c}" for c in cols.split(", ")[1:])
+                + ", updated_at=" + ("CURRENT_TIMESTAMP" if sqlite else "now()")
+            )
+            # старая БД без exchange: 'gate' подставляет сам SELECT — строка всегда из 9 колонок
+            sel_cols = cols if has_ex else cols + ", 'gate'"
+            out[(dialect, has_ex)] = {
+                "select_pairs_all": f"SELECT {sel_cols} FROM bot_pairs ORDER BY idx ASC",
+                "select_pairs_enabled": f"SELECT {sel_cols} FROM bot_pairs WHERE enabled = {enabled_true} ORDER BY idx ASC",
+                "count_enabled": f"SELECT COUNT(*) FROM bot_pairs WHERE enabled = {enabled_true}",
+                # сид дефолтной пары только в пустую таблицу — одним запросом, без SELECT count(*).
+                # PG: нетипизированные литералы в SELECT-списке стали бы text — числа приводим явно;
+                # ON CONFLICT — на случай одновременного старта web и worker.
+                "seed_pair": (
+                    f"INSERT INTO bot_pairs({cols}) SELECT {','.join([ph] * n_cols)} "
+                    "WHERE NOT EXISTS (SELECT 1 FROM bot_pairs)"
+                    if sqlite else
+                    f"INSERT INTO bot_pairs({cols}) "
+                    "SELECT %s, %s, CAST(%s AS numeric), CAST(%s AS numeric), CAST(%s AS numeric), "
+                    "%s, CAST(%s AS numeric), %s" + (", %s" if has_ex else "") + " "
+                    "WHERE NOT EXISTS (SELECT 1 FROM bot_pairs) ON CONFLICT DO NOTHING"
+                ),
+                # пакетный upsert по слоту idx: SQLite (>= 3.24) — executemany построчно, PG — execute_values
+                "upsert_pairs": f"INSERT INTO bot_pairs({cols}) VALUES "
+                                + (f"({','.join([ph] * n_cols)})" if sqlite else "%s") + upsert_set,
+                # с RETURNING: итоговые строки приходят ответом на сам INSERT (SQLite — см. _sqlite_upsert_pairs_returning)
+                "upsert_pairs_returning": f"INSERT INTO bot_pairs({cols}) VALUES %s" + upsert_set + f" RETURNING {sel_cols}",
+                "pair_cols": cols,
+                "pair_sel_cols": sel_cols,
+                "pair_row_ph": f"({','.join([ph] * n_cols)})",
+                "pair_upsert_set": upsert_set,
+                "select_pair_slots": "SELECT idx, pair FROM bot_pairs",
+                "delete_pair_slot": f"DELETE FROM bot_pairs WHERE idx = {ph}",
+                # has_ex: точное совпадение по бирже и паре; старая БД без exchange — по pair
+                "delete_pair": (f"DELETE FROM bot_pairs WHERE pair = {ph} AND LOWER(exchange)=LOWER({ph})" if has_ex
+                                else f"DELETE FROM bot_pairs WHERE pair = {ph}"),
+                "get_runtime": f"SELECT value FROM bot_runtime WHERE key={ph};",
+                "set_runtime": set_runtime,
+                "upsert_settings": upsert_settings,
+                "load_overrides": load_overrides,
+                "load_state": load_state,
+            }
+    return out
+
+_SQL_VARIANTS = _build_sql_variants()
 
-# --- helper: detect sqlite connection ---
-def _is_sqlite_conn(conn) -> bool:
+# INSERT ... RETURNING в SQLite — с 3.35
+_SQLITE_HAS_RETURNING = sqlite3.sqlite_version_info >= (3, 35, 0)
+
+@lru_cache(maxsize=64)
+def _sqlite_upsert_pairs_returning(has_ex: bool, n: int) -> str:
+    """SQLite: upsert n пар одним INSERT (многострочный VALUES) + RETURNING; текст кэшируется по n."""
+    q = _SQL_VARIANTS[("sqlite", has_ex)]
+    return (f"INSERT INTO bot_pairs({q['pair_cols']}) VALUES " + ",".join([q["pair_row_ph"]] * n)
+            + q["pair_upsert_set"] + f" RETURNING {q['pair_sel_cols']}")
+
+# SQLite: INSERT OR REPLACE с n строками в одном VALUES (n = 1..len(ALLOWED_KEYS)) — один оператор на сохранение
+_SQLITE_UPSERT_SETTINGS_N: Dict[int, str] = {
+    n: "INSERT OR REPLACE INTO bot_settings(key, value, updated_at) VALUES "
+       + ",".join(["(?, ?, CURRENT_TIMESTAMP)"] * n)
+    for n in range(1, len(ALLOWED_KEYS) + 1)
+}
+
+def _sql_for(conn, has_exchange: bool = True) -> Dict[str, str]:
+    """Набор SQL из _SQL_VARIANTS под диалект соединения."""
+    return _SQL_VARIANTS[("sqlite" if _is_sqlite_conn(conn) else "pg", has_exchange)]
+
+# Один писатель на процесс: записи (ensure_schema, флаги, настройки, пары) идут по очереди
+# на RW-соединении, чтения берут RO-соединения пула без блокировки.
+# RLock — запись может вызвать другую запись в том же потоке.
+_WRITE_LOCK = threading.RLock()
+
+@contextmanager
+def _writer_conn():
+    with _WRITE_LOCK:
+        with pooled_conn() as conn:
+            yield conn
+
+@contextmanager
+def _transaction(cur, is_sqlite: bool):
+    """
+    Явная транзакция поверх autocommit-соединения (SQLite isolation_level=None / psycopg2 autocommit).
+    COMMIT при успехе, ROLLBACK при исключении.
+    SQLite: BEGIN IMMEDIATE — блокировку записи берём сразу (с ожиданием busy-timeout),
+    а не при первой записи, где её апгрейд может упасть с SQLITE_BUSY.
+    """
+    cur.execute("BEGIN IMMEDIATE" if is_sqlite else "BEGIN")
     try:
-        mod = conn.__class__.__module__
-        if mod and mod.startswith("sqlite3"):
-            return True
-    except Exception:
-        pass
-    if not hasattr(conn, "closed") and hasattr(conn, "execute"):
-        return True
-    return False
+        yield
+    except BaseException:
+        try:
+            cur.execute("ROLLBACK")
+        except _DB_ERRORS as e:
+            log.debug("ROLLBACK failed: %r", e)
+        raise
+    cur.execute("COMMIT")
+
+def _pg_insert_many(cur, sql: str, rows: List[tuple]) -> None:
+    """Postgres: многострочный INSERT одним запросом (execute_values, sql с одним %s под VALUES)."""
+    execute_values(cur, sql, rows, page_size=200)
+
+def _pg_upsert_returning(cur, sql: str, rows: List[tuple]) -> List[tuple]:
+    """Postgres: execute_values(..., fetch=True) — строки RETURNING одной пачкой."""
+    return list(execute_values(cur, sql, rows, page_size=len(rows), fetch=True))
+
+# Статистика планировщика: SQLite — PRAGMA optimize (сам решает, нужен ли ANALYZE, обычно no-op),
+# Postgres — ANALYZE bot_pairs. На старте (SQLite) и каждые _OPTIMIZE_EVERY записей в bot_pairs:
+# upsert_pairs переписывает таблицу целиком, статистика быстро устаревает.
+# Плюс по времени (optimize_tick из торгового цикла, раз в _OPTIMIZE_INTERVAL).
+_OPTIMIZE_EVERY = 100
+_OPTIMIZE_INTERVAL = 6 * 3600
+_pair_writes = 0
+_last_optimize = time.monotonic()
+
+def _run_optimize(cur, is_sqlite: bool) -> None:
+    try:
+        cur.execute("PRAGMA optimize" if is_sqlite else "ANALYZE bot_pairs")
+    except _DB_ERRORS as e:
+        log.debug("optimize failed: %r", e)
+
+def run_optimize() -> None:
+    """Обновить статистику планировщика (дёшево, если обновлять нечего)."""
+    global _last_optimize
+    _last_optimize = time.monotonic()
+    with _writer_conn() as conn, _cursor(conn) as cur:
+        _run_optimize(cur, _is_sqlite_conn(conn))
+
+def optimize_tick() -> None:
+    if time.monotonic() - _last_optimize >= _OPTIMIZE_INTERVAL:
+        run_optimize()
+
+def _note_pair_write(cur, is_sqlite: bool) -> None:
+    """Счётчик записей в bot_pairs (вызывается под _WRITE_LOCK)."""
+    global _pair_writes
+    _pair_writes += 1
+    if _pair_writes % _OPTIMIZE_EVERY == 0:
+        _run_optimize(cur, is_sqlite)
+
+# Кэш набора колонок по таблице: один запрос интроспекции на таблицу, дальше _has_column —
+# проверка по frozenset. Схема во время работы не меняется; кэш сбрасывается
+# в ensure_schema() и после миграций (db_migrate.run_all -> invalidate_schema_cache).
+_TABLE_COLS_CACHE: Dict[Tuple[bool, str], frozenset] = {}
+_SQLITE_HAS_PRAGMA_TVF = sqlite3.sqlite_version_info >= (3, 16, 0)  # pragma_table_info(...)
+# до завершения миграций отсутствие колонки не кэшируем: её может добавить соседний процесс (web/worker)
+_SCHEMA_MIGRATED = False
+
+def invalidate_schema_cache(migrated: bool = False) -> None:
+    global _SCHEMA_MIGRATED
+    if migrated:
+        _SCHEMA_MIGRATED = True
+    _TABLE_COLS_CACHE.clear()
+
+def _table_columns(conn, table: str) -> frozenset | None:
+    """Все имена колонок таблицы одним запросом; None — ошибка интроспекции (не кэшируем)."""
+    is_sqlite = _is_sqlite_conn(conn)
+    key = (is_sqlite, table)
+    cols = _TABLE_COLS_CACHE.get(key)
+    if cols is not None:
+        return cols
+    try:
+        with _cursor(conn) as cur:
+            if is_sqlite and _SQLITE_HAS_PRAGMA_TVF:
+                # табличная функция: только имена, имя таблицы — параметром, а не в тексте SQL
+                cur.execute("SELECT name FROM pragma_table_info(?)", (table,))
+                cols = frozenset(row[0] for row in (cur.fetchall() or []))
+            elif is_sqlite:
+                cur.execute(f"PRAGMA table_info({table})")
+                cols = frozenset(row[1] for row in (cur.fetchall() or []))  # имя колонки — 2-й столбец
+            else:
+                cur.execute("SELECT column_name FROM information_schema.columns WHERE table_name=%s", (table,))
+                cols = frozenset(row[0] for row in (cur.fetchall() or []))
+    except _DB_ERRORS as e:
+        log.debug("columns of %s: %r", table, e)
+        return None
+    _TABLE_COLS_CACHE[key] = cols
+    return cols
 
 def _has_column(conn, table: str, column: str) -> bool:
     """
     Идемпотентно проверяет наличие колонки в таблице для SQLite/Postgres.
     """
-    cur = None
-    try:
-        cur = conn.cursor()
-        if _is_sqlite_conn(conn):
-            cur.execute(f"PRAGMA table_info({table})")
-            rows = cur.fetchall() or []
-            cols = [row[1] for row in rows]  # имя колонки — 2-й столбец
-            return column in cols
-        else:
-            cur.execute("""
-                SELECT 1
-                  FROM information_schema.columns
-                 WHERE table_name=%s AND column_name=%s
-                 LIMIT 1
-            """, (table, column))
-            return cur.fetchone() is not None
-    except Exception:
+    cols = _table_columns(conn, table)
+    if cols is None:
         return False
-    finally:
-        try:
-            cur and cur.close()
-        except Exception:
-            pass
+    if column in cols:
+        return True
+    if not _SCHEMA_MIGRATED:
+        _TABLE_COLS_CACHE.pop((_is_sqlite_conn(conn), table), None)
+    return False
 
 def ensure_schema():
     """
@@ -86,125 +323,79 @@ def ensure_schema():
     Работает как с SQLite, так и с Postgres (Heroku).
     """
     init_db()
-    conn = get_conn()
-    cur = None
-    try:
-        cur = conn.cursor()
-        # Если таблицы нет — init_db() должен был её создать; здесь просто проверим содержимое
-        cur.execute("SELECT count(*) FROM bot_pairs;")
-        row = cur.fetchone()
-        cnt = int(row[0]) if row else 0
-
-        has_ex = _has_column(conn, "bot_pairs", "exchange")
-
-        if cnt == 0:
-            if _is_sqlite_conn(conn):
-                if has_ex:
-                    cur.execute(
-                        "INSERT INTO bot_pairs(idx, pair, deviation_pct, quote, lot_size_base, gap_mode, gap_switch_pct, enabled, exchange) "
-                        "VALUES (?,?,?,?,?,?,?,?,?)",
-                        (1, PAIR, str(DEVIATION_PCT), str(QUOTE_USDT), str(LOT_SIZE_BASE), GAP_MODE, str(GAP_SWITCH_PCT), 1, "gate")
-                    )
-                else:
-                    cur.execute(
-                        "INSERT INTO bot_pairs(idx, pair, deviation_pct, quote, lot_size_base, gap_mode, gap_switch_pct, enabled) "
-                        "VALUES (?,?,?,?,?,?,?,?)",
-                        (1, PAIR, str(DEVIATION_PCT), str(QUOTE_USDT), str(LOT_SIZE_BASE), GAP_MODE, str(GAP_SWITCH_PCT), 1)
-                    )
-            else:
-                # Postgres: используем %s и булевы типы True/False
-                if has_ex:
-                    cur.execute(
-                        "INSERT INTO bot_pairs(idx, pair, deviation_pct, quote, lot_size_base, gap_mode, gap_switch_pct, enabled, exchange) "
-                        "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)",
-                        (1, PAIR, str(DEVIATION_PCT), str(QUOTE_USDT), str(LOT_SIZE_BASE),
-                         GAP_MODE, str(GAP_SWITCH_PCT), True, "gate")
-                    )
-                else:
-                    cur.execute(
-                        "INSERT INTO bot_pairs(idx, pair, deviation_pct, quote, lot_size_base, gap_mode, gap_switch_pct, enabled) "
-                        "VALUES (%s,%s,%s,%s,%s,%s,%s,%s)",
-                        (1, PAIR, str(DEVIATION_PCT), str(QUOTE_USDT), str(LOT_SIZE_BASE),
-                         GAP_MODE, str(GAP_SWITCH_PCT), True)
-                    )
-    finally:
-        try:
-            if cur is not None:
-                cur.close()
-        except Exception:
-            pass
-
+    invalidate_schema_cache()
+    _store_overrides(None)
+    _store_pairs(None)
+    with _writer_conn() as conn:
+        with _cursor(conn) as cur:
+            is_sqlite = _is_sqlite_conn(conn)
+            has_ex = _has_column(conn, "bot_pairs", "exchange")
+            # Проверка пустоты + сид — один INSERT ... WHERE NOT EXISTS (атомарно сам по себе)
+            # SQLite: enabled = 1; Postgres: булев True
+            row = (1, PAIR, str(DEVIATION_PCT), str(QUOTE_USDT), str(LOT_SIZE_BASE),
+                   GAP_MODE, str(GAP_SWITCH_PCT), 1 if is_sqlite else True)
+            cur.execute(_sql_for(conn, has_ex)["seed_pair"], row + ("gate",) if has_ex else row)
+            if is_sqlite:
+                _run_optimize(cur, True)
+
+
+# ------- runtime-флаги (paused/shutdown) -------
+# Пишутся синхронно: стоп/пауза из админки критичны, ошибка записи должна дойти до вызывающего.
+# Кэш прочитанных флагов: key -> (monotonic-время, значение). get_paused/get_shutdown дёргаются
+# на каждой итерации цикла; свои записи видны сразу (кэш обновляет _set_runtime после записи),
+# чужие (админка -> воркер) — не позже чем через _RUNTIME_TTL.
+_RUNTIME_TTL = 1.0
+_RUNTIME_CACHE: Dict[str, Tuple[float, str | None]] = {}
+_runtime_version = 0
+_runtime_lock = threading.Lock()
+
+def _set_runtime(key: str, value: str) -> None:
+    global _runtime_version
+    with _writer_conn() as conn:
+        with _cursor(conn) as cur:
+            cur.execute(_sql_for(conn)["set_runtime"], (key, value))
+    with _runtime_lock:
+        _runtime_version += 1
+        _RUNTIME_CACHE[key] = (time.monotonic(), value)
+
+def _get_runtime(key: str):
+    cached = _RUNTIME_CACHE.get(key)
+    if cached is not None and time.monotonic() - cached[0] < _RUNTIME_TTL:
+        return cached[1]
+    version = _runtime_version
+    with pooled_conn(readonly=True) as conn:
+        rows = _query(conn, _sql_for(conn)["get_runtime"], (key,))
+    val = rows[0][0] if rows else None
+    with _runtime_lock:
+        # запись флага во время чтения — не затираем её старым значением из БД
+        if version == _runtime_version:
+            _RUNTIME_CACHE[key] = (time.monotonic(), val)
+    return val
+
+def _paused_flag(val) -> bool:
+    if val is None: return False
+    return str(val).lower() in ("1","true","yes","y")
+
+def _shutdown_flag(val) -> bool:
+    if val is None: return False
+    return str(val).strip().lower() in ("1","true","yes","y","on")
 
 def get_paused() -> bool:
-    conn = get_conn()
-    cur = None
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT value FROM bot_runtime WHERE key='paused';")
-        row = cur.fetchone()
-        if not row: return False
-        val = row[0] if isinstance(row, (list, tuple)) else row
-        return str(val).lower() in ("1","true","yes","y")
-    finally:
-        try:
-            if cur is not None: cur.close()
-        except Exception: pass
+    return _paused_flag(_get_runtime("paused"))
 
 def set_paused(flag: bool):
-    conn = get_conn()
-    cur = None
-    try:
-        cur = conn.cursor()
-        if _is_sqlite_conn(conn):
-            cur.execute("INSERT OR REPLACE INTO bot_runtime(key, value, updated_at) VALUES ('paused', ?, CURRENT_TIMESTAMP)",
-                        ("true" if flag else "false",))
-        else:
-            cur.execute("INSERT INTO bot_runtime(key, value) VALUES ('paused', %s) "
-                        "ON CONFLICT (key) DO UPDATE SET value=EXCLUDED.value, updated_at=now()",
-                        ("true" if flag else "false",))
-    finally:
-        try:
-            if cur is not None: cur.close()
-        except Exception: pass
+    _set_runtime("paused", "true" if flag else "false")
 
 # ------- STOP/SHUTDOWN флаг -------
 def get_shutdown() -> bool:
-    conn = get_conn()
-    cur = None
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT value FROM bot_runtime WHERE key='shutdown';")
-        row = cur.fetchone()
-        if not row: return False
-        val = row[0] if isinstance(row, (list, tuple)) else row
-        return str(val).strip().lower() in ("1","true","yes","y","on")
-    finally:
-        try:
-            cur and cur.close()
-        except Exception:
-            pass
+    return _shutdown_flag(_get_runtime("shutdown"))
 
 def set_shutdown(flag: bool):
-    conn = get_conn()
-    cur = None
-    try:
-        cur = conn.cursor()
-        if _is_sqlite_conn(conn):
-            cur.execute("INSERT OR REPLACE INTO bot_runtime(key, value, updated_at) VALUES ('shutdown', ?, CURRENT_TIMESTAMP)",
-                        ("true" if flag else "false",))
-        else:
-            cur.execute("INSERT INTO bot_runtime(key, value) VALUES ('shutdown', %s) "
-                        "ON CONFLICT (key) DO UPDATE SET value=EXCLUDED.value, updated_at=now()",
-                        ("true" if flag else "false",))
-    finally:
-        try:
-            cur and cur.close()
-        except Exception:
-            pass
+    _set_runtime("shutdown", "true" if flag else "false")
 # -------------------------------
 
-def load_overrides() -> Dict[str, Any]:
-    conn = get_conn()
+def _overrides_from_rows(rows) -> Dict[str, Any]:
+    """Дефолты из config + значения из bot_settings (rows: (key, value))."""
     out: Dict[str, Any] = {
         "PAIR": PAIR,
         "DEVIATION_PCT": DEVIATION_PCT,
@@ -215,74 +406,112 @@ def load_overrides() -> Dict[str, Any]:
         # дефолт, если не задано в БД
         "REPORT_INTERVAL": "hourly",
     }
-    cur = None
-    try:
-        cur = conn.cursor()
-        cur.execute("SELECT key, value FROM bot_settings;")
-        rows = cur.fetchall()
-        for r in rows:
-            k = r[0]; v = r[1]
-            if k in ALLOWED_KEYS:
-                try:
-                    out[k] = _coerce(k, v)
-                except Exception:
-                    pass
-    finally:
+    for r in rows:
+        k = r[0]; v = r[1]
+        conv = _CONVERTERS.get(k)
+        if conv is None:
+            continue
         try:
-            if cur is not None: cur.close()
-        except Exception: pass
+            out[k] = conv(v)
+        except (ValueError, TypeError, ArithmeticError) as e:
+            # битое значение в bot_settings — остаётся дефолт, но не молча
+            log.warning("bot_settings: bad value %s=%r ignored (%s)", k, v, e)
     return out
 
-def upsert_params(upd: Dict[str, Any]) -> Dict[str, Any]:
-    if not upd:
-        return load_overrides()
-    conn = get_conn()
-    cur = None
-    try:
-        cur = conn.cursor()
-        is_sqlite = _is_sqlite_conn(conn)
-        for k, raw in upd.items():
-            if k not in ALLOWED_KEYS: continue
-            v = str(_coerce(k, str(raw)))
-            if is_sqlite:
-                cur.execute("INSERT OR REPLACE INTO bot_settings(key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)", (k, v))
-            else:
-                cur.execute("INSERT INTO bot_settings(key, value) VALUES (%s, %s) "
-                            "ON CONFLICT (key) DO UPDATE SET value=EXCLUDED.value, updated_at=now()", (k, v))
-    finally:
-        try:
-            if cur is not None: cur.close()
-        except Exception: pass
-    return load_overrides()
+def _overrides_query(is_sqlite: bool) -> Tuple[str, tuple]:
+    sql = _SQL_VARIANTS[("sqlite" if is_sqlite else "pg", True)]["load_overrides"]
+    return sql, (tuple(ALLOWED_KEYS) if is_sqlite else (list(ALLOWED_KEYS),))
+
+def _read_overrides(cur, is_sqlite: bool) -> Dict[str, Any]:
+    cur.execute(*_overrides_query(is_sqlite))
+    return _overrides_from_rows(cur.fetchall())
+
+# Кэш load_overrides в процессе: (monotonic-время, значения). В этом процессе upsert_params
+# сразу обновляет кэш; записи из других процессов (несколько web-воркеров) подхватятся
+# по _OVERRIDES_TTL. Версия защищает от гонки: чтение, начатое до записи,
+# не перезапишет кэш устаревшими данными.
+_OVERRIDES_TTL = 5.0
+_OVERRIDES_CACHE: Tuple[float, Dict[str, Any]] | None = None
+_OVERRIDES_VERSION: int = 0
+_overrides_lock = threading.Lock()
 
-def _select_pairs_rows(conn, include_disabled: bool, has_exchange: bool) -> Tuple[List[tuple], List[str]]:
+def _store_overrides(out: Dict[str, Any] | None, version: int | None = None) -> None:
     """
-    Унифицированный SELECT по bot_pairs с/без колонки exchange.
-    Возвращает (rows, cols).
+    version=None — запись (новая версия); иначе — кэшируем, только если версия не сменилась.
+    out=None — просто сбросить кэш.
     """
-    cur = None
-    try:
-        cur = conn.cursor()
-        base_cols = "idx, pair, deviation_pct, quote, lot_size_base, gap_mode, gap_switch_pct, enabled"
-        cols = base_cols + (", exchange" if has_exchange else "")
-        if include_disabled:
-            if _is_sqlite_conn(conn):
-                cur.execute(f"SELECT {cols} FROM bot_pairs ORDER BY idx ASC")
-            else:
-                cur.execute(f"SELECT {cols} FROM bot_pairs ORDER BY idx ASC")
+    global _OVERRIDES_CACHE, _OVERRIDES_VERSION
+    with _overrides_lock:
+        if version is None:
+            _OVERRIDES_VERSION += 1
+        elif version != _OVERRIDES_VERSION:
+            return
+        _OVERRIDES_CACHE = (time.monotonic(), out) if out is not None else None
+
+def load_overrides() -> Dict[str, Any]:
+    cached = _OVERRIDES_CACHE
+    if cached is not None and time.monotonic() - cached[0] < _OVERRIDES_TTL:
+        return dict(cached[1])
+    version = _OVERRIDES_VERSION
+    with pooled_conn(readonly=True) as conn:
+        out = _overrides_from_rows(_query(conn, *_overrides_query(_is_sqlite_conn(conn))))
+    _store_overrides(out, version)
+    return dict(out)
+
+_RUNTIME_STATE_KEYS = ("paused", "shutdown")
+
+def load_state() -> Tuple[bool, bool, Dict[str, Any]]:
+    """
+    (paused, shutdown, overrides) одним запросом вместо get_paused + get_shutdown + load_overrides.
+    Кэш overrides обновляется.
+    """
+    version = _OVERRIDES_VERSION
+    with pooled_conn(readonly=True) as conn:
+        if _is_sqlite_conn(conn):
+            rows = _query(conn, _SQL_VARIANTS[("sqlite", True)]["load_state"], _RUNTIME_STATE_KEYS + tuple(ALLOWED_KEYS))
         else:
-            if _is_sqlite_conn(conn):
-                cur.execute(f"SELECT {cols} FROM bot_pairs WHERE enabled = 1 ORDER BY idx ASC")
-            else:
-                cur.execute(f"SELECT {cols} FROM bot_pairs WHERE enabled = %s ORDER BY idx ASC", (True,))
-        rows = cur.fetchall()
-        colnames = [d[0] for d in cur.description] if getattr(cur, "description", None) else cols.split(", ")
-        return rows, colnames
-    finally:
-        try:
-            cur and cur.close()
-        except Exception:
-            pass
+            rows = _query(conn, _SQL_VARIANTS[("pg", True)]["load_state"], (list(_RUNTIME_STATE_KEYS), list(ALLOWED_KEYS)))
+    runtime = {k: v for src, k, v in rows if src == "r"}
+    out = _overrides_from_rows([(k, v) for src, k, v in rows if src == "s"])
+    _store_overrides(out, version)
+    return _paused_flag(runtime.get("paused")), _shutdown_flag(runtime.get("shutdown")), dict(out)
+
+def upsert_params(upd: Dict[str, Any]) -> Dict[str, Any]:
+    rows = [(k, _to_storage(k, raw)) for k, raw in (upd or {}).items() if k in ALLOWED_KEYS]
+    if not rows:
+        return load_overrides()
+    with _writer_conn() as conn:
+        with _cursor(conn) as cur:
+            is_sqlite = _is_sqlite_conn(conn)
+            # Свежий кэш (админка обычно читает load_overrides() прямо перед сохранением) —
+            # итог = кэш + записанные ключи, без обратного SELECT. Иначе — чтение в той же транзакции.
+            cached = _OVERRIDES_CACHE
+            fresh = cached is not None and time.monotonic() - cached[0] < _OVERRIDES_TTL
+            # Пакетная запись всех ключей одним запросом
+            with _transaction(cur, is_sqlite):
+                if is_sqlite:
+                    cur.execute(_SQLITE_UPSERT_SETTINGS_N[len(rows)], [x for r in rows for x in r])
+                else:
+                    _pg_insert_many(cur, _sql_for(conn)["upsert_settings"], rows)
+                if not fresh:
+                    out = _read_overrides(cur, is_sqlite)
+            if fresh:
+                out = dict(cached[1])
+                out.update((k, _CONVERTERS[k](v)) for k, v in rows)
+    _store_overrides(out)
+    return dict(out)
+
+# Строки bot_pairs читаем итерацией по курсору, а не fetchall: PairCfg строится по ходу чтения,
+# без промежуточного списка всех строк (и без списков-пачек fetchmany).
+# Порядок колонок фиксирован SELECT-ом (_PAIR_BASE_COLS + exchange/'gate') — строки распаковываем
+# по позиции (в _build_pairs), без cur.description и словаря имя->позиция; idx — первая колонка
+_C_IDX = 0
+
+def _select_pairs(cur, conn, include_disabled: bool, has_exchange: bool) -> None:
+    """
+    Унифицированный SELECT по bot_pairs с/без колонки exchange (строки — итерацией по cur).
+    """
+    cur.execute(_sql_for(conn, has_exchange)["select_pairs_all" if include_disabled else "select_pairs_enabled"])
 
 def _as_int(val, default: int) -> int:
     try:
@@ -294,62 +523,130 @@ def _as_int(val, default: int) -> int:
         if not s:
             return default
         return int(float(s))
-    except Exception:
+    except (ValueError, TypeError, OverflowError):
         return default
 
+# enabled: bool/0/1 из драйвера — одним поиском в таблице (1 == True, 0 == False по хэшу);
+# остальное (строки, прочие числа) — медленный путь
+_ENABLED_FAST: Dict[Any, bool] = {True: True, False: False}
+_TRUTHY_STR = frozenset(("1", "true", "yes", "y", "on"))
+
+def _as_enabled(val) -> bool:
+    en = _ENABLED_FAST.get(val)
+    if en is not None:
+        return en
+    if isinstance(val, (int, float)):
+        return bool(int(val))
+    return str(val).strip().lower() in _TRUTHY_STR
+
+def _dec_via_str(v) -> Decimal:
+    return Decimal(str(v))
+
+# Приведение числовых колонок bot_pairs к Decimal по типу значения из драйвера.
+# SQLite (NUMERIC affinity) отдаёт int/float/str вперемешку, psycopg2 — сразу Decimal.
+# float — через str (точное двоичное значение нам не нужно), NULL в старых БД — общий ноль.
+_DEC_FROM_DB = {Decimal: lambda v: v, str: Decimal, int: Decimal, type(None): lambda v: _DEC_ZERO}
+
+def _db_dec(v) -> Decimal:
+    return _DEC_FROM_DB.get(type(v), _dec_via_str)(v)
+
+# Кэш list_pairs в процессе: include_disabled -> (monotonic-время, пары). Торговый цикл,
+# отчёты и админка читают пары на каждом шаге; upsert_pairs/delete_pair в этом процессе
+# обновляют кэш сразу, записи из другого процесса (web <-> worker) подхватятся по _PAIRS_TTL.
+# Версия — как у _OVERRIDES_VERSION: чтение, начатое до записи, не закэширует старый набор.
+_PAIRS_TTL = 2.0
+_PAIRS_CACHE: Dict[bool, Tuple[float, List[PairCfg]]] = {}
+_PAIRS_VERSION: int = 0
+_pairs_lock = threading.Lock()
+
+def _store_pairs(saved: List[PairCfg] | None) -> None:
+    """После записи пар: новая версия, кэш сброшен; saved — полный набор (include_disabled=True)."""
+    global _PAIRS_VERSION
+    with _pairs_lock:
+        _PAIRS_VERSION += 1
+        _PAIRS_CACHE.clear()
+        if saved is not None:
+            _PAIRS_CACHE[True] = (time.monotonic(), saved)
+
 def list_pairs(include_disabled: bool = False) -> List[PairCfg]:
     """
     Возвращает пары из БД. Терпимо относится к NULL/'' в idx, корректно приводит enabled,
     и подставляет 'gate' как биржу по умолчанию для старых БД.
     """
-    conn = get_conn()
+    include_disabled = bool(include_disabled)
+    cached = _PAIRS_CACHE.get(include_disabled)
+    if cached is not None and time.monotonic() - cached[0] < _PAIRS_TTL:
+        return [PairCfg(p) for p in cached[1]]
+    version = _PAIRS_VERSION
+    with pooled_conn(readonly=True) as conn:
+        out = _list_pairs_on(conn, include_disabled)
+    with _pairs_lock:
+        if version == _PAIRS_VERSION:
+            _PAIRS_CACHE[include_disabled] = (time.monotonic(), out)
+    return [PairCfg(p) for p in out]
+
+def _list_pairs_on(conn, include_disabled: bool) -> List[PairCfg]:
     has_ex = _has_column(conn, "bot_pairs", "exchange")
-    rows, cols = _select_pairs_rows(conn, include_disabled, has_ex)
+    with _cursor(conn) as cur:
+        _select_pairs(cur, conn, include_disabled, has_ex)
+        return _build_pairs(iter(cur))
+
+def _build_pairs(rows: Iterator[tuple]) -> List[PairCfg]:
+    # _db_dec — по каждому значению: типы могут отличаться от строки к строке (NULL/str в старых БД)
+    to_dec = _db_dec
+    return [
+        PairCfg(
+            idx=_as_int(idx, pos),
+            pair=str(pair),
+            deviation_pct=to_dec(dev),
+            quote=to_dec(quote),
+            lot_size_base=to_dec(lot),
+            gap_mode=str(mode),
+            gap_switch_pct=to_dec(gs),
+            enabled=_as_enabled(en),
+            exchange=(str(ex) or "gate").strip().lower(),
+        )
+        for pos, (idx, pair, dev, quote, lot, mode, gs, en, ex) in enumerate(rows, start=1)
+    ]
 
-    out: List[PairCfg] = []
-    col_idx = {name: i for i, name in enumerate(cols)}
+# Кэш числа активных пар (для heartbeat): (monotonic-время, значение)
+_ACTIVE_COUNT_TTL = 60.0
+_active_count_cache: Tuple[float, int] | None = None
 
-    for pos, r in enumerate(rows, start=1):
-        idx_val = _as_int(r[col_idx["idx"]], pos)
+def _invalidate_active_count() -> None:
+    global _active_count_cache
+    _active_count_cache = None
 
-        en_raw = r[col_idx["enabled"]]
-        if isinstance(en_raw, bool):
-            enabled = en_raw
-        elif isinstance(en_raw, (int, float)):
-            enabled = bool(int(en_raw))
-        else:
-            enabled = str(en_raw).strip().lower() in ("1", "true", "yes", "y", "on")
-
-        cfg: PairCfg = PairCfg(
-            idx=idx_val,
-            pair=str(r[col_idx["pair"]]),
-            deviation_pct=Decimal(str(r[col_idx["deviation_pct"]])),
-            quote=Decimal(str(r[col_idx["quote"]])),
-            lot_size_base=Decimal(str(r[col_idx["lot_size_base"]])),
-            gap_mode=str(r[col_idx["gap_mode"]]),
-            gap_switch_pct=Decimal(str(r[col_idx["gap_switch_pct"]])),
-            enabled=enabled,
-        )
-        if has_ex and "exchange" in col_idx:
-            cfg["exchange"] = (str(r[col_idx["exchange"]]) or "gate").strip().lower()
-        else:
-            cfg["exchange"] = "gate"
-        out.append(cfg)
-
-    return out
+def active_pair_count() -> int:
+    """
+    Число активных пар — SELECT COUNT(*) без разбора строк в PairCfg.
+    Кэшируется на _ACTIVE_COUNT_TTL сек; upsert_pairs/delete_pair сбрасывают кэш
+    (изменения из другого процесса подхватятся по TTL).
+    """
+    global _active_count_cache
+    cached = _active_count_cache
+    now = time.monotonic()
+    if cached is not None and now - cached[0] < _ACTIVE_COUNT_TTL:
+        return cached[1]
+
+    with pooled_conn(readonly=True) as conn:
+        rows = _query(conn, _sql_for(conn)["count_enabled"])
+    cnt = int(rows[0][0]) if rows else 0
+    _active_count_cache = (now, cnt)
+    return cnt
 
 def upsert_pairs(pairs: List[PairCfg]) -> List[PairCfg]:
     """
     Принимаем пары из /admin и полностью перезаписываем таблицу bot_pairs.
     Теперь сохраняем exchange из запроса (валидация по реестру), без жёсткого 'gate'.
     """
-    allowed_ex = set(available_exchanges())
+    allowed_ex = available_exchange_set()
 
     norm: List[PairCfg] = []
     seen_pairs: set[Tuple[str,str]] = set()
     for i, p in enumerate(pairs, start=1):
         pair = str(p.get("pair","")).strip().upper()
-        if not pair or "_" not in pair:
+        if not _PAIR_RE.fullmatch(pair):
             raise ValueError(f"Некорректный PAIR в слоте {i}: '{pair}'")
 
         ex = str(p.get("exchange","gate")).strip().lower() or "gate"
@@ -361,127 +658,139 @@ def upsert_pairs(pairs: List[PairCfg]) -> List[PairCfg]:
             raise ValueError(f"Дубликат пары для биржи {ex}: {pair}")
         seen_pairs.add(key)
 
-        if "gap_switch_pct" in p:
-            gs = Decimal(str(p.get("gap_switch_pct","1")))
-        else:
-            gs = Decimal("1")
-
         norm.append(PairCfg(
             idx=i,
             exchange=ex,
             pair=pair,
-            deviation_pct=Decimal(str(p.get("deviation_pct","0"))),
-            quote=Decimal(str(p.get("quote","0"))),
-            lot_size_base=Decimal(str(p.get("lot_size_base","0"))),
+            deviation_pct=_pair_dec(p.get("deviation_pct")),
+            quote=_pair_dec(p.get("quote")),
+            lot_size_base=_pair_dec(p.get("lot_size_base")),
             gap_mode=str(p.get("gap_mode","down_only")).lower(),
-            gap_switch_pct=gs,
+            gap_switch_pct=_pair_dec(p.get("gap_switch_pct"), _DEC_ONE),
             enabled=bool(p.get("enabled", True)),
         ))
 
-    conn = get_conn()
-    has_ex = _has_column(conn, "bot_pairs", "exchange")
-    cur = None
-    try:
-        cur = conn.cursor()
-        # Полная замена набора
-        cur.execute("DELETE FROM bot_pairs;")
+    with _writer_conn() as conn:
+        has_ex = _has_column(conn, "bot_pairs", "exchange")
         is_sqlite = _is_sqlite_conn(conn)
-        for p in norm:
-            if has_ex:
-                if is_sqlite:
-                    cur.execute(
-                        "INSERT INTO bot_pairs(idx, pair, deviation_pct, quote, lot_size_base, gap_mode, gap_switch_pct, enabled, exchange) "
-                        "VALUES (?,?,?,?,?,?,?,?,?)",
-                        (p["idx"], p["pair"], str(p["deviation_pct"]), str(p["quote"]), str(p["lot_size_base"]),
-                         p["gap_mode"], str(p["gap_switch_pct"]), 1 if p["enabled"] else 0, p["exchange"])
-                    )
+
+        q = _sql_for(conn, has_ex)
+        # ветки диалекта/exchange — один раз, а не на каждой строке
+        en = (lambda v: 1 if v else 0) if is_sqlite else bool
+        rows = [
+            # Decimal — как есть: psycopg2 адаптирует сам, для SQLite адаптер в core.db
+            (p["idx"], p["pair"], p["deviation_pct"], p["quote"], p["lot_size_base"],
+             p["gap_mode"], p["gap_switch_pct"], en(p["enabled"]))
+            for p in norm
+        ]
+        if has_ex:
+            rows = [row + (p["exchange"],) for row, p in zip(rows, norm)]
+
+        with _cursor(conn) as cur:
+            # Полная замена набора — одной транзакцией, без DELETE всей таблицы:
+            # 1) удаляем слоты за пределами нового набора и строки пар, переехавших в другой слот
+            #    (иначе upsert упрётся в уникальный индекс по pair);
+            # 2) upsert по idx — остальные слоты обновляются на месте.
+            new_idx = {p["pair"]: p["idx"] for p in norm}
+            with _transaction(cur, is_sqlite):
+                cur.execute(q["select_pair_slots"])
+                stale = [(idx,) for idx, pair in cur.fetchall()
+                         if idx > len(norm) or new_idx.get(pair, idx) != idx]
+                if stale:
+                    cur.executemany(q["delete_pair_slot"], stale)
+                # Итог — из БД, а не norm: SQLite (NUMERIC) и Postgres (numeric(36,18)) меняют
+                # запись чисел (3.0 -> 3 / 3.000000000000000000), а админка сравнивает до/после как строки.
+                # После чистки выше в таблице остаются ровно upsert-нутые строки, поэтому RETURNING
+                # отдаёт весь итоговый набор тем же запросом; без RETURNING — SELECT в той же транзакции.
+                returned = None
+                if rows:
+                    if is_sqlite and _SQLITE_HAS_RETURNING:
+                        cur.execute(_sqlite_upsert_pairs_returning(has_ex, len(rows)), [x for r in rows for x in r])
+                        returned = cur.fetchall()
+                    elif is_sqlite:
+                        cur.executemany(q["upsert_pairs"], rows)
+                    else:
+                        returned = _pg_upsert_returning(cur, q["upsert_pairs_returning"], rows)
                 else:
-                    cur.execute(
-                        "INSERT INTO bot_pairs(idx, pair, deviation_pct, quote, lot_size_base, gap_mode, gap_switch_pct, enabled, exchange) "
-                        "VALUES (%s,%s,%s,%s,%s,%s,%s,%s,%s)",
-                        (p["idx"], p["pair"], str(p["deviation_pct"]), str(p["quote"]), str(p["lot_size_base"]),
-                         p["gap_mode"], str(p["gap_switch_pct"]), True if p["enabled"] else False, p["exchange"])
-                    )
-            else:
-                if is_sqlite:
-                    cur.execute(
-                        "INSERT INTO bot_pairs(idx, pair, deviation_pct, quote, lot_size_base, gap_mode, gap_switch_pct, enabled) "
-                        "VALUES (?,?,?,?,?,?,?,?)",
-                        (p["idx"], p["pair"], str(p["deviation_pct"]), str(p["quote"]), str(p["lot_size_base"]),
-                         p["gap_mode"], str(p["gap_switch_pct"]), 1 if p["enabled"] else 0)
-                    )
+                    returned = []
+                if returned is not None:
+                    returned.sort(key=lambda r: r[_C_IDX])
+                    saved = _build_pairs(iter(returned))
                 else:
-                    cur.execute(
-                        "INSERT INTO bot_pairs(idx, pair, deviation_pct, quote, lot_size_base, gap_mode, gap_switch_pct, enabled) "
-                        "VALUES (%s,%s,%s,%s,%s,%s,%s,%s)",
-                        (p["idx"], p["pair"], str(p["deviation_pct"]), str(p["quote"]), str(p["lot_size_base"]),
-                         p["gap_mode"], str(p["gap_switch_pct"]), True if p["enabled"] else False)
-                    )
-    finally:
-        try:
-            if cur is not None: cur.close()
-        except Exception:
-            pass
-
-    return list_pairs(include_disabled=True)
+                    saved = _list_pairs_on(conn, True)
+            _note_pair_write(cur, is_sqlite)
+
+    _invalidate_active_count()
+    _store_pairs(saved)
+    return [PairCfg(p) for p in saved]
+
+# Перенумерация idx одним set-based UPDATE (вместо SELECT + N×UPDATE).
+# idx — первичный ключ, а уникальность проверяется построчно, поэтому в два шага:
+# сначала idx = -rn (отрицательные не пересекаются с текущими), затем знак обратно.
+_RESEQ_ORDER_EX = "ORDER BY COALESCE(idx, 1000000000), exchange, pair"
+_RESEQ_ORDER_NOEX = "ORDER BY COALESCE(idx, 1000000000), pair"
+_RESEQ_SQL: Dict[bool, str] = {
+    # has_exchange -> UPDATE ... FROM (SQLite >= 3.33 и Postgres понимают одинаково)
+    True: (
+        "UPDATE bot_pairs SET idx = -r.rn "
+        "FROM (SELECT pair AS r_pair, exchange AS r_ex, ROW_NUMBER() OVER (" + _RESEQ_ORDER_EX + ") AS rn FROM bot_pairs) AS r "
+        "WHERE bot_pairs.pair = r.r_pair AND bot_pairs.exchange = r.r_ex"
+    ),
+    False: (
+        "UPDATE bot_pairs SET idx = -r.rn "
+        "FROM (SELECT pair AS r_pair, ROW_NUMBER() OVER (" + _RESEQ_ORDER_NOEX + ") AS rn FROM bot_pairs) AS r "
+        "WHERE bot_pairs.pair = r.r_pair"
+    ),
+}
+_RESEQ_FLIP_SQL = "UPDATE bot_pairs SET idx = -idx WHERE idx < 0"
+# SQLite < 3.33 не знает UPDATE ... FROM: порядок читаем SELECT-ом, пишем одним executemany
+_SQLITE_HAS_UPDATE_FROM = sqlite3.sqlite_version_info >= (3, 33, 0)
+_RESEQ_SELECT_SQL: Dict[bool, str] = {
+    True: "SELECT pair, exchange FROM bot_pairs " + _RESEQ_ORDER_EX,
+    False: "SELECT pair FROM bot_pairs " + _RESEQ_ORDER_NOEX,
+}
+_RESEQ_ROW_SQL: Dict[bool, str] = {
+    True: "UPDATE bot_pairs SET idx = ? WHERE pair = ? AND exchange = ?",
+    False: "UPDATE bot_pairs SET idx = ? WHERE pair = ?",
+}
 
-def _resequence_pairs(conn) -> None:
+def _resequence_pairs(conn, has_ex: bool | None = None) -> None:
     """
     Устойчиво перенумеровывает idx: если есть колонка exchange — учитываем её,
     чтобы одинаковые пары на разных биржах не конфликтовали.
+    has_ex — уже известный вызывающему признак колонки exchange.
     """
-    cur = conn.cursor()
-    try:
-        has_ex = _has_column(conn, "bot_pairs", "exchange")
-        if has_ex:
-            # читаем обе колонки, упорядочим стабильно (сначала текущий idx, затем exchange/pair)
-            cur.execute("SELECT idx, exchange, pair FROM bot_pairs ORDER BY idx ASC, exchange ASC, pair ASC;")
-            rows = cur.fetchall() or []
-            for new_idx, row in enumerate(rows, start=1):
-                _old_idx, ex, pr = row
-                if _is_sqlite_conn(conn):
-                    cur.execute("UPDATE bot_pairs SET idx=? WHERE pair=? AND LOWER(exchange)=LOWER(?)", (new_idx, pr, ex))
-                else:
-                    cur.execute("UPDATE bot_pairs SET idx=%s WHERE pair=%s AND LOWER(exchange)=LOWER(%s)", (new_idx, pr, ex))
+    with _cursor(conn) as cur:
+        # idx уникален (PK): MIN=1 и MAX=COUNT — значит уже 1..N без дыр, переписывать нечего
+        cur.execute("SELECT MIN(idx), MAX(idx), COUNT(*) FROM bot_pairs")
+        lo, hi, cnt = cur.fetchone()
+        if not cnt or (lo == 1 and hi == cnt):
+            return
+        if has_ex is None:
+            has_ex = _has_column(conn, "bot_pairs", "exchange")
+        if _SQLITE_HAS_UPDATE_FROM or not _is_sqlite_conn(conn):
+            cur.execute(_RESEQ_SQL[has_ex])
         else:
-            # старая схема — переносим по pair
-            cur.execute("SELECT idx, pair FROM bot_pairs ORDER BY idx ASC, pair ASC;")
-            rows = cur.fetchall() or []
-            pairs_sorted = [r[1] for r in rows]
-            for new_idx, pair in enumerate(pairs_sorted, start=1):
-                cur.execute(
-                    "UPDATE bot_pairs SET idx=%s WHERE pair=%s;" if not _is_sqlite_conn(conn)
-                    else "UPDATE bot_pairs SET idx=? WHERE pair=?;",
-                    (new_idx, pair)
-                )
-    finally:
-        try: cur.close()
-        except Exception: pass
+            cur.execute(_RESEQ_SELECT_SQL[has_ex])
+            cur.executemany(_RESEQ_ROW_SQL[has_ex], [(-rn,) + tuple(r) for rn, r in enumerate(cur.fetchall(), start=1)])
+        cur.execute(_RESEQ_FLIP_SQL)
 
 def delete_pair(exchange: str, pair: str) -> bool:
     """
     Удаляет запись пары из bot_pairs с учётом мультибиржи.
     Возвращает True, если что-то удалено.
     """
-    conn = get_conn()
-    cur = conn.cursor()
-    has_ex = _has_column(conn, "bot_pairs", "exchange")
-    try:
-        if has_ex:
-            # точное совпадение по бирже и паре
-            if _is_sqlite_conn(conn):
-                cur.execute("DELETE FROM bot_pairs WHERE pair = ? AND LOWER(exchange)=LOWER(?)", (pair, exchange))
-            else:
-                cur.execute("DELETE FROM bot_pairs WHERE pair = %s AND LOWER(exchange)=LOWER(%s)", (pair, exchange))
-        else:
-            # старая БД — без колонки exchange: удаляем по pair
-            if _is_sqlite_conn(conn):
-                cur.execute("DELETE FROM bot_pairs WHERE pair = ?", (pair,))
-            else:
-                cur.execute("DELETE FROM bot_pairs WHERE pair = %s", (pair,))
-        deleted = cur.rowcount if hasattr(cur, "rowcount") else 0
-        _resequence_pairs(conn)
-        return deleted > 0
-    finally:
-        try: cur.close()
-        except Exception: pass
+    with _writer_conn() as conn, _cursor(conn) as cur:
+        has_ex = _has_column(conn, "bot_pairs", "exchange")
+        is_sqlite = _is_sqlite_conn(conn)
+        # DELETE + перенумерация — одной транзакцией: без промежуточного состояния с дырой в idx
+        with _transaction(cur, is_sqlite):
+            cur.execute(_sql_for(conn, has_ex)["delete_pair"], (pair, exchange) if has_ex else (pair,))
+            deleted = cur.rowcount if hasattr(cur, "rowcount") else 0
+            if deleted <= 0:
+                return False
+            _resequence_pairs(conn, has_ex)
+        _note_pair_write(cur, is_sqlite)
+        _invalidate_active_count()
+        _store_pairs(None)
+        return True
@@ -1,12 +1,21 @@
-from decimal import Decimal
+from decimal import Decimal, ROUND_DOWN
+from functools import lru_cache
+
+@lru_cache(maxsize=64)
+def _quantum(prec: int) -> Decimal:
+    return Decimal(1) if prec <= 0 else Decimal(1).scaleb(-prec)
 
 def dquant(x: Decimal, prec: int) -> Decimal:
-    if prec <= 0:
-        q = Decimal(1)
-    else:
-        q = Decimal(1).scaleb(-prec)
-    return (x // q) * q
+    # усечение к нулю до prec знаков — одним quantize (то же, что (x // q) * q)
+    return x.quantize(_quantum(prec), rounding=ROUND_DOWN)
+
+@lru_cache(maxsize=4096)
+def _fmt_cached(x: Decimal, prec: int) -> str:
+    return f"{dquant(x, prec):f}"
 
 def fmt(x: Decimal, prec: int) -> str:
-    q = dquant(x, prec)
-    return f"{q:f}"
+    # Значений за тик немного (цены/объёмы/параметры пар) — строку берём из кэша.
+    # Нули мимо кэша: -0 == 0 с тем же хэшем, иначе знак нуля взялся бы из первого вызова.
+    if not x:
+        return f"{dquant(x, prec):f}"
+    return _fmt_cached(x, prec)
@@ -1,13 +1,14 @@
 # core/reporting.py
 from __future__ import annotations
 from decimal import Decimal
-from typing import Tuple, Dict, Any, List, Optional
-import time, csv, io
+from typing import Tuple, Dict, Any, List, NamedTuple, Optional
+import atexit, time, csv, io
 from datetime import datetime, timezone
 from concurrent.futures import ThreadPoolExecutor
+from operator import attrgetter
 import threading
 
-from core.db import get_conn
+from core.db import pooled_conn, closing_cursor, query as _query, is_sqlite_conn as _is_sqlite_conn
 from core.params import list_pairs, get_paused
 from core.quant import fmt
 from core.telemetry import send_event, send_document
@@ -18,94 +19,106 @@ SETTINGS_KEY_ENABLED     = "REPORT_ENABLED"
 SETTINGS_KEY_PERIOD_MIN  = "REPORT_PERIOD_MIN"       # 1|5|10|15|30|60
 RUNTIME_KEY_LAST_END_TS  = "report_last_period_end"  # unix seconds конца ПРЕДЫДУЩЕГО завершенного периода
 
+_D0 = Decimal("0")
+
 # ======== Фоновый исполнитель для отчётов (НЕ блокирует торговлю) ========
-_BG_EXEC = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reporting")
+# Оба пула создаются при первом отчёте (отчёты по умолчанию выключены) и гасятся при выходе.
+_BG_EXEC: ThreadPoolExecutor | None = None
 _BG_LOCK = threading.Lock()  # защитимся от двойного планирования в одну и ту же минуту
+# Пул для параллельной выгрузки сделок (чистый сетевой I/O): пара × {buy, sell}
+_FETCH_WORKERS = 8
+_FETCH_EXEC: ThreadPoolExecutor | None = None
+_EXEC_LOCK = threading.Lock()
+
+def _get_bg_exec() -> ThreadPoolExecutor:
+    global _BG_EXEC
+    with _EXEC_LOCK:
+        if _BG_EXEC is None:
+            _BG_EXEC = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reporting")
+        return _BG_EXEC
+
+def _get_fetch_exec() -> ThreadPoolExecutor:
+    global _FETCH_EXEC
+    with _EXEC_LOCK:
+        if _FETCH_EXEC is None:
+            _FETCH_EXEC = ThreadPoolExecutor(max_workers=_FETCH_WORKERS, thread_name_prefix="report-fetch")
+        return _FETCH_EXEC
+
+def _shutdown_executors() -> None:
+    for ex in (_BG_EXEC, _FETCH_EXEC):
+        if ex is not None:
+            ex.shutdown(wait=False, cancel_futures=True)
+
+atexit.register(_shutdown_executors)
 
 # ========== Утилиты БД ==========
-def _is_sqlite_conn(conn) -> bool:
-    try:
-        return conn.__class__.__module__.startswith("sqlite3")
-    except Exception:
-        return (not hasattr(conn, "closed")) and hasattr(conn, "execute")
-
-def _kv_get(key: str) -> str | None:
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT value FROM bot_settings WHERE key=%s;" if not _is_sqlite_conn(conn) else
-                    "SELECT value FROM bot_settings WHERE key=?;", (key,))
-        row = cur.fetchone()
-        if not row:
-            return None
-        return row[0] if isinstance(row, (list, tuple)) else row
-    finally:
-        try: cur.close()
-        except Exception: pass
+def _kv_get_many(keys: List[str]) -> Dict[str, str]:
+    """Несколько ключей bot_settings одним SELECT ... IN (...); отсутствующих ключей в ответе нет."""
+    if not keys:
+        return {}
+    with pooled_conn(readonly=True) as conn:
+        ph = ",".join(["?" if _is_sqlite_conn(conn) else "%s"] * len(keys))
+        rows = _query(conn, f"SELECT key, value FROM bot_settings WHERE key IN ({ph});", tuple(keys))
+    return {row[0]: row[1] for row in rows}
 
 def _kv_set(key: str, value: str) -> None:
-    conn = get_conn()
-    is_sqlite = _is_sqlite_conn(conn)
-    cur = conn.cursor()
-    try:
-        if is_sqlite:
+    with pooled_conn() as conn, closing_cursor(conn) as cur:
+        if _is_sqlite_conn(conn):
             cur.execute("INSERT OR REPLACE INTO bot_settings(key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)", (key, value))
         else:
             cur.execute("INSERT INTO bot_settings(key, value) VALUES (%s, %s) ON CONFLICT (key) DO UPDATE SET value=EXCLUDED.value, updated_at=now()", (key, value))
-    finally:
-        try: cur.close()
-        except Exception: pass
 
 def _rt_get(key: str) -> str | None:
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        cur.execute("SELECT value FROM bot_runtime WHERE key=%s;" if not _is_sqlite_conn(conn) else
-                    "SELECT value FROM bot_runtime WHERE key=?;", (key,))
-        row = cur.fetchone()
-        if not row:
-            return None
-        return row[0] if isinstance(row, (list, tuple)) else row
-    finally:
-        try: cur.close()
-        except Exception: pass
+    with pooled_conn(readonly=True) as conn:
+        rows = _query(conn, "SELECT value FROM bot_runtime WHERE key=%s;" if not _is_sqlite_conn(conn) else
+                      "SELECT value FROM bot_runtime WHERE key=?;", (key,))
+    return rows[0][0] if rows else None
 
 def _rt_set(key: str, value: str) -> None:
-    conn = get_conn()
-    is_sqlite = _is_sqlite_conn(conn)
-    cur = conn.cursor()
-    try:
-        if is_sqlite:
+    with pooled_conn() as conn, closing_cursor(conn) as cur:
+        if _is_sqlite_conn(conn):
             cur.execute("INSERT OR REPLACE INTO bot_runtime(key, value, updated_at) VALUES (?, ?, CURRENT_TIMESTAMP)", (key, value))
         else:
             cur.execute("INSERT INTO bot_runtime(key, value) VALUES (%s, %s) ON CONFLICT (key) DO UPDATE SET value=EXCLUDED.value, updated_at=now()", (key, value))
-    finally:
-        try: cur.close()
-        except Exception: pass
 
 # ========== Настройки отчётов ==========
 def _normalize_period(p: int) -> int:
     allowed = (1,5,10,15,30,60)
     return p if p in allowed else 60
 
+# tick() зовётся на каждой итерации торгового цикла, а настройки меняются руками из админки:
+# держим их в памяти _SETTINGS_TTL сек (set_settings в этом процессе сбрасывает кэш сразу,
+# изменения из веб-процесса воркер увидит не позже чем через TTL).
+_SETTINGS_TTL = 10.0
+_SETTINGS_CACHE: Tuple[float, bool, int] | None = None
+
 def get_settings() -> Tuple[bool, int]:
+    global _SETTINGS_CACHE
+    cached = _SETTINGS_CACHE
+    if cached is not None and time.monotonic() - cached[0] < _SETTINGS_TTL:
+        return cached[1], cached[2]
     enabled = False
     period_min = 60
-    v = _kv_get(SETTINGS_KEY_ENABLED)
+    kv = _kv_get_many([SETTINGS_KEY_ENABLED, SETTINGS_KEY_PERIOD_MIN])
+    v = kv.get(SETTINGS_KEY_ENABLED)
     if v is not None:
         enabled = str(v).lower() in ("1","true","yes","y","on")
-    v = _kv_get(SETTINGS_KEY_PERIOD_MIN)
+    v = kv.get(SETTINGS_KEY_PERIOD_MIN)
     if v is not None:
         try:
             period_min = int(str(v))
         except Exception:
             period_min = 60
-    return enabled, _normalize_period(period_min)
+    period_min = _normalize_period(period_min)
+    _SETTINGS_CACHE = (time.monotonic(), enabled, period_min)
+    return enabled, period_min
 
 def set_settings(enabled: bool, period_min: int) -> Tuple[bool, int]:
+    global _SETTINGS_CACHE
     period_min = _normalize_period(period_min)
     _kv_set(SETTINGS_KEY_ENABLED, "true" if enabled else "false")
     _kv_set(SETTINGS_KEY_PERIOD_MIN, str(period_min))
+    _SETTINGS_CACHE = None
     return get_settings()
 
 # ========== Временные правила и окна ==========
@@ -168,14 +181,33 @@ def _norm_trade_row(tr: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         return None
 
 # ========== Сбор сделок ==========
-def _collect_trades_for_pairs(pairs: List[Dict[str, Any]], buy_win: Tuple[int,int], sell_win: Tuple[int,int]) -> List[Dict[str, Any]]:
+# Строка сделки — NamedTuple (не dict): компактнее, поля по атрибуту без хэш-таблицы на строку.
+# quote_value считаем сразу при сборе: BUY отрицательный, SELL положительный.
+class TradeRow(NamedTuple):
+    ts: int
+    id: str
+    ts_iso: str
+    exchange: str
+    pair: str
+    side: str           # BUY|SELL
+    price: Decimal
+    amount: Decimal
+    quote_value: Decimal
+    fee: Decimal
+    fee_currency: str
+    fee_kind: str       # _FEE_USDT|_FEE_BASE|_FEE_OTHER
+
+def _collect_trades_for_pairs(pairs: List[Dict[str, Any]], buy_win: Tuple[int,int], sell_win: Tuple[int,int]) -> List[TradeRow]:
     """
     Собираем сделки по всем парам в нужных окнах через exchange_proxy.
-    На выходе нормализованные строки для дальнейшего расчёта/CSV.
+    На выходе нормализованные строки (TradeRow) для дальнейшего расчёта/CSV.
     """
-    rows: List[Dict[str, Any]] = []
+    rows: List[TradeRow] = []
+    ts_iso_memo: Dict[int, str] = {}  # у сделок одной секунды — одна строка времени
 
     def _add_rows(exch: str, pair: str, base_sym: str, side_filter: str, tr_list: List[Dict[str, Any]]) -> None:
+        base_up = base_sym.upper()
+        side_up = side_filter.upper()  # BUY|SELL
         for tr in tr_list:
             r = _norm_trade_row(tr)
             if not r:
@@ -183,47 +215,58 @@ def _collect_trades_for_pairs(pairs: List[Dict[str, Any]], buy_win: Tuple[int,in
             if r["side"] != side_filter:
                 continue
             ts = int(r["ts"])
-            rows.append({
-                "ts": ts,
-                "ts_iso": datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S"),
-                "exchange": exch,
-                "pair": pair,
-                "base": base_sym,
-                "side": side_filter.upper(),  # BUY|SELL
-                "price": r["price"],
-                "amount": r["amount"],
-                "fee": r.get("fee", "0"),
-                "fee_currency": r.get("fee_currency", ""),
-                "id": r.get("trade_id", ""),
-            })
+            ts_iso = ts_iso_memo.get(ts)
+            if ts_iso is None:
+                ts_iso = ts_iso_memo[ts] = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
+            # числа разбираем один раз здесь; дальше (TEXT/CSV/JSON) — готовые Decimal
+            price = Decimal(r["price"])
+            amount = Decimal(r["amount"])
+            qv = amount * price
+            if side_up == "BUY":
+                qv = -qv
+            fee_cur = r.get("fee_currency", "")
+            rows.append(TradeRow(
+                ts, r.get("trade_id", ""), ts_iso, exch, pair, side_up,
+                price, amount, qv, Decimal(r["fee"]), fee_cur, _fee_kind(fee_cur, base_up),
+            ))
+
+    def _fetch(exch: str, pair: str, win: Tuple[int,int]) -> List[Dict[str, Any]]:
+        try:
+            return exchange_proxy.fetch_trades(
+                pair=pair, exchange=exch, start_ts=win[0], end_ts=win[1], limit=1000
+            ) or []
+        except Exception:
+            return []
 
+    # BUY: [S-60, E-60], SELL: [S, E] — все запросы сразу в пул, время ≈ самый долгий запрос.
+    # Результаты разбираем в порядке задач (а не по готовности): итог детерминирован, как раньше.
+    tasks = []
+    fetch_exec = _get_fetch_exec()
     for p in pairs:
         pair = p["pair"]
         exch = p.get("exchange", "gate")  # back-compat: по умолчанию gate
-        base_sym = pair.split("_", 1)[0] if "_" in pair else pair
+        base_sym = pair.partition("_")[0]  # без "_" — вся строка
+        for side, win in (("buy", buy_win), ("sell", sell_win)):
+            tasks.append((exch, pair, base_sym, side, fetch_exec.submit(_fetch, exch, pair, win)))
 
-        # BUY: [S-60, E-60]
-        try:
-            buy_trades = exchange_proxy.fetch_trades(
-                pair=pair, exchange=exch, start_ts=buy_win[0], end_ts=buy_win[1], limit=1000
-            ) or []
-        except Exception:
-            buy_trades = []
-        _add_rows(exch, pair, base_sym, "buy", buy_trades)
+    for exch, pair, base_sym, side, fut in tasks:
+        _add_rows(exch, pair, base_sym, side, fut.result())
 
-        # SELL: [S, E]
-        try:
-            sell_trades = exchange_proxy.fetch_trades(
-                pair=pair, exchange=exch, start_ts=sell_win[0], end_ts=sell_win[1], limit=1000
-            ) or []
-        except Exception:
-            sell_trades = []
-        _add_rows(exch, pair, base_sym, "sell", sell_trades)
-
-    rows.sort(key=lambda r: (r["ts"], r["id"]))
+    rows.sort(key=attrgetter("ts", "id"))
     return rows
 
-def _fee_to_usdt(side: str, base: str, fee: Decimal, fee_currency: str, price: Decimal) -> Decimal:
+# Вид комиссии классифицируем один раз при сборе строки (без upper()/сравнений в цикле расчёта)
+_FEE_USDT, _FEE_BASE, _FEE_OTHER = "USDT", "BASE", "OTHER"
+
+def _fee_kind(fee_currency: str, base_up: str) -> str:
+    fc = str(fee_currency).upper()
+    if fc == "USDT":
+        return _FEE_USDT
+    if fc == base_up:
+        return _FEE_BASE
+    return _FEE_OTHER
+
+def _fee_to_usdt(kind: str, fee: Decimal, price: Decimal) -> Decimal:
     """
     Конвертируем комиссию в USDT:
     - если fee_currency == USDT -> как есть
@@ -231,64 +274,76 @@ def _fee_to_usdt(side: str, base: str, fee: Decimal, fee_currency: str, price: D
     - иначе (например, GT) -> 0 (не учитываем в сумме, курс неизвестен)
     """
     if fee <= 0:
-        return Decimal("0")
-    if fee_currency.upper() == "USDT":
+        return _D0
+    if kind == _FEE_USDT:
         return fee
-    if fee_currency.upper() == base.upper():
+    if kind == _FEE_BASE:
         try:
             return (fee * price)
         except Exception:
-            return Decimal("0")
-    return Decimal("0")
+            return _D0
+    return _D0
 
-# ========== Текст отчёта (с NET) ==========
-def build_report_text(period_min: int, ref_end_ts: int) -> str:
-    paused = get_paused()
+# ========== Общий расчёт отчёта ==========
+def _compute_report(period_min: int, ref_end_ts: int) -> Dict[str, Any]:
+    """
+    Один сбор сделок и один проход по ним для всех форматов (TEXT/CSV/JSON):
+    пары, окна, строки сделок, итоги по (exchange, pair) и общий.
+    """
     pairs = list_pairs(include_disabled=True)
 
     S, E = _period_bounds_by_end(ref_end_ts, period_min)
     (buy_s, buy_e), (sell_s, sell_e) = _buy_sell_windows(S, E)
 
-    def ts_fmt(ts: int) -> str:
-        return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
-
-    # Подсчёт NET (М5: добавили разрез по (exchange, pair))
     rows = _collect_trades_for_pairs(pairs, (buy_s, buy_e), (sell_s, sell_e))
 
-    total_quote_all = Decimal("0")
-    total_fee_all   = Decimal("0")
+    total_quote_all = _D0
+    total_fee_all   = _D0
 
     # M5: агрегаты по (exchange, pair)
     group_totals: Dict[Tuple[str, str], Dict[str, Decimal]] = {}  # {(ex, pair): {"q":..., "fee":...}}
 
     for r in rows:
-        price  = Decimal(str(r["price"]))
-        amount = Decimal(str(r["amount"]))
-        fee    = Decimal(str(r.get("fee","0")))
-        base   = str(r.get("base",""))
-        side   = r["side"]
-        ex     = str(r.get("exchange","gate"))
-        pair   = str(r["pair"])
-
-        qv = (amount * price)
-        if side == "BUY":
-            qv = -qv
-        fee_usdt = _fee_to_usdt(side, base, fee, str(r.get("fee_currency","")), price)
+        qv = r.quote_value
+        # fee в USDT (накапливаем для NET)
+        fee_usdt = _fee_to_usdt(r.fee_kind, r.fee, r.price)
 
         # общий итог
         total_quote_all += qv
         total_fee_all   += fee_usdt
 
         # по группе
-        key = (ex, pair)
+        key = (r.exchange, r.pair)
         g = group_totals.get(key)
         if not g:
-            g = {"q": Decimal("0"), "fee": Decimal("0")}
+            g = {"q": _D0, "fee": _D0}
             group_totals[key] = g
         g["q"]   += qv
         g["fee"] += fee_usdt
 
-    net_all = total_quote_all - total_fee_all
+    return {
+        "pairs": pairs,
+        "buy": (buy_s, buy_e),
+        "sell": (sell_s, sell_e),
+        "rows": rows,
+        # стабильный порядок групп: по exchange, затем pair
+        "groups": sorted(group_totals.items()),
+        "total_quote": total_quote_all,
+        "total_fee": total_fee_all,
+        "net": total_quote_all - total_fee_all,
+    }
+
+# ========== Текст отчёта (с NET) ==========
+def build_report_text(period_min: int, ref_end_ts: int, ctx: Dict[str, Any] | None = None) -> str:
+    """ctx — готовый _compute_report(...) (чтобы TEXT и CSV одного отчёта не собирали сделки дважды)."""
+    paused = get_paused()
+    if ctx is None:
+        ctx = _compute_report(period_min, ref_end_ts)
+    pairs = ctx["pairs"]
+    (buy_s, buy_e), (sell_s, sell_e) = ctx["buy"], ctx["sell"]
+
+    def ts_fmt(ts: int) -> str:
+        return datetime.fromtimestamp(ts, tz=timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC")
 
     lines: List[str] = []
     lines.append(f"<b>Отчёт за период {period_min} мин</b>")
@@ -298,16 +353,14 @@ def build_report_text(period_min: int, ref_end_ts: int) -> str:
     lines.append(f"Всего пар: {len(pairs)}; активных: {sum(1 for p in pairs if p.get('enabled'))}")
 
     # M5: NET по (exchange, pair)
-    if group_totals:
+    if ctx["groups"]:
         lines.append("<b>NET по биржам и парам (USDT):</b>")
-        # сортировка: по exchange, затем по pair
-        for (ex, pair) in sorted(group_totals.keys(), key=lambda k: (k[0], k[1])):
-            g = group_totals[(ex, pair)]
+        for (ex, pair), g in ctx["groups"]:
             net_g = g["q"] - g["fee"]
             lines.append(f"• [{ex}:{pair}] NET={fmt(net_g, 6)} (fee={fmt(g['fee'],6)} USDT)")
 
     # Общий итог (USDT) — дублирует CSV
-    lines.append(f"<b>Итог NET (USDT):</b> {fmt(net_all, 6)}")
+    lines.append(f"<b>Итог NET (USDT):</b> {fmt(ctx['net'], 6)}")
 
     # Справочная строка по конфигурации пар (как было)
     for p in pairs:
@@ -319,71 +372,33 @@ def build_report_text(period_min: int, ref_end_ts: int) -> str:
                 dev=fmt(p["deviation_pct"], 3),
                 mode=p["gap_mode"],
                 gs=fmt(p["gap_switch_pct"], 2),
-                lot_or_quote=("LOT="+fmt(p["lot_size_base"],8)) if Decimal(str(p["lot_size_base"]))>0 else ("QUOTE="+fmt(p["quote"],2)),
+                lot_or_quote=("LOT="+fmt(p["lot_size_base"],8)) if p["lot_size_base"] > 0 else ("QUOTE="+fmt(p["quote"],2)),
                 en=("✅" if p.get("enabled") else "🚫")
             )
         )
     return "\n".join(lines)
 
 # ========== CSV с итоговой строкой ==========
-def build_report_csv(period_min: int, ref_end_ts: int) -> bytes:
-    pairs = list_pairs(include_disabled=True)
-    S, E = _period_bounds_by_end(ref_end_ts, period_min)
-    (buy_s, buy_e), (sell_s, sell_e) = _buy_sell_windows(S, E)
-
-    rows = _collect_trades_for_pairs(pairs, (buy_s, buy_e), (sell_s, sell_e))
+def build_report_csv(period_min: int, ref_end_ts: int, ctx: Dict[str, Any] | None = None) -> bytes:
+    if ctx is None:
+        ctx = _compute_report(period_min, ref_end_ts)
 
-    total_quote_all = Decimal("0")
-    total_fee_all   = Decimal("0")
-
-    # M5: агрегаты по (exchange, pair)
-    group_totals: Dict[Tuple[str, str], Dict[str, Decimal]] = {}  # {(ex, pair): {"q":..., "fee":...}}
-
-    buf = io.StringIO()
+    # пишем сразу в байты (UTF-8), без итоговой копии getvalue().encode()
+    raw = io.BytesIO()
+    buf = io.TextIOWrapper(raw, encoding="utf-8", newline="")
     wr = csv.writer(buf)
     # v0.7.2+: колонка exchange (третья)
     wr.writerow(["ts","ts_iso","exchange","pair","side","price","amount","quote_value","fee","fee_currency","trade_id"])
 
-    for r in rows:
-        price  = Decimal(str(r["price"]))
-        amount = Decimal(str(r["amount"]))
-        fee    = Decimal(str(r.get("fee", "0")))
-        base   = str(r.get("base",""))
-        side   = r["side"]
-        ex     = str(r.get("exchange","gate"))
-        pair   = str(r["pair"])
-
-        # quote_value: BUY отрицательный, SELL положительный
-        qv = (amount * price)
-        if side == "BUY":
-            qv = -qv
-
-        # fee в USDT (накапливаем для NET)
-        fee_usdt = _fee_to_usdt(side, base, fee, str(r.get("fee_currency","")), price)
-
-        # общий итог
-        total_quote_all += qv
-        total_fee_all   += fee_usdt
-
-        # групповые итоги
-        key = (ex, pair)
-        g = group_totals.get(key)
-        if not g:
-            g = {"q": Decimal("0"), "fee": Decimal("0")}
-            group_totals[key] = g
-        g["q"]   += qv
-        g["fee"] += fee_usdt
-
-        wr.writerow([
-            r["ts"], r["ts_iso"], ex, pair, side,
-            str(price), str(amount), str(qv),
-            str(fee), r.get("fee_currency",""), r["id"]
-        ])
+    for r in ctx["rows"]:
+        wr.writerow((
+            r.ts, r.ts_iso, r.exchange, r.pair, r.side,
+            str(r.price), str(r.amount), str(r.quote_value),
+            str(r.fee), r.fee_currency, r.id
+        ))
 
     # M5: Итоговые строки по каждой (exchange, pair)
-    # Стабильный порядок: сортируем по exchange, затем pair
-    for (ex, pair) in sorted(group_totals.keys(), key=lambda k: (k[0], k[1])):
-        g = group_totals[(ex, pair)]
+    for (ex, pair), g in ctx["groups"]:
         net_g = g["q"] - g["fee"]
         wr.writerow([
             "TOTAL", "", ex, pair,
@@ -392,17 +407,18 @@ def build_report_csv(period_min: int, ref_end_ts: int) -> bytes:
         ])
 
     # Общий итог (как раньше: exchange=ALL, pair=NET)
-    net_all = total_quote_all - total_fee_all
     wr.writerow([
         "TOTAL", "", "ALL", "NET",
-        "", "", str(net_all),
-        str(total_fee_all), "USDT", ""
+        "", "", str(ctx["net"]),
+        str(ctx["total_fee"]), "USDT", ""
     ])
 
-    return buf.getvalue().encode("utf-8")
+    buf.flush()
+    buf.detach()
+    return raw.getvalue()
 
 # ========== Структурированный JSON-отчёт (для /reporting) ==========
-def build_report_json(period_min: int, ref_end_ts: int) -> Dict[str, Any]:
+def build_report_json(period_min: int, ref_end_ts: int, ctx: Dict[str, Any] | None = None) -> Dict[str, Any]:
     """
     Возвращает структурированный отчёт:
     {
@@ -418,47 +434,14 @@ def build_report_json(period_min: int, ref_end_ts: int) -> Dict[str, Any]:
       "total": {"quote":"...","fee_usdt":"...","net":"..."}
     }
     """
-    from decimal import Decimal  # локальный импорт для ясности
     paused = get_paused()
-    pairs = list_pairs(include_disabled=True)
-
-    S, E = _period_bounds_by_end(ref_end_ts, period_min)
-    (buy_s, buy_e), (sell_s, sell_e) = _buy_sell_windows(S, E)
-
-    rows = _collect_trades_for_pairs(pairs, (buy_s, buy_e), (sell_s, sell_e))
-
-    total_quote_all = Decimal("0")
-    total_fee_all   = Decimal("0")
-    group_totals: Dict[Tuple[str, str], Dict[str, Decimal]] = {}
-
-    for r in rows:
-        price  = Decimal(str(r["price"]))
-        amount = Decimal(str(r["amount"]))
-        fee    = Decimal(str(r.get("fee","0")))
-        base   = str(r.get("base",""))
-        side   = r["side"]
-        ex     = str(r.get("exchange","gate"))
-        pair   = str(r["pair"])
-
-        qv = (amount * price)
-        if side == "BUY":
-            qv = -qv
-        fee_usdt = _fee_to_usdt(side, base, fee, str(r.get("fee_currency","")), price)
-
-        total_quote_all += qv
-        total_fee_all   += fee_usdt
-
-        key = (ex, pair)
-        g = group_totals.get(key)
-        if not g:
-            g = {"q": Decimal("0"), "fee": Decimal("0")}
-            group_totals[key] = g
-        g["q"]   += qv
-        g["fee"] += fee_usdt
+    if ctx is None:
+        ctx = _compute_report(period_min, ref_end_ts)
+    pairs = ctx["pairs"]
+    (buy_s, buy_e), (sell_s, sell_e) = ctx["buy"], ctx["sell"]
 
     groups_out: List[Dict[str, Any]] = []
-    for (ex, pair) in sorted(group_totals.keys(), key=lambda k: (k[0], k[1])):
-        g = group_totals[(ex, pair)]
+    for (ex, pair), g in ctx["groups"]:
         net_g = g["q"] - g["fee"]
         groups_out.append({
             "exchange": ex,
@@ -468,7 +451,6 @@ def build_report_json(period_min: int, ref_end_ts: int) -> Dict[str, Any]:
             "net": str(net_g),
         })
 
-    net_all = total_quote_all - total_fee_all
     return {
         "period_min": period_min,
         "bounds": {
@@ -480,9 +462,9 @@ def build_report_json(period_min: int, ref_end_ts: int) -> Dict[str, Any]:
         "pairs_active": sum(1 for p in pairs if p.get("enabled")),
         "groups": groups_out,
         "total": {
-            "quote": str(total_quote_all),
-            "fee_usdt": str(total_fee_all),
-            "net": str(net_all),
+            "quote": str(ctx["total_quote"]),
+            "fee_usdt": str(ctx["total_fee"]),
+            "net": str(ctx["net"]),
         },
     }
 
@@ -497,17 +479,26 @@ def _get_last_period_end_ts() -> int:
 def _set_last_period_end_ts(ts_val: int) -> None:
     _rt_set(RUNTIME_KEY_LAST_END_TS, str(int(ts_val)))
 
+def _send_report_for(period_min: int, end_ts: int) -> None:
+    """
+    Сборка + отправка отчёта за период с концом end_ts.
+    Нет сделок — только текст: CSV был бы из одних нулевых итогов, документ в Telegram не шлём.
+    """
+    ctx = _compute_report(period_min, end_ts)
+    send_event("report", build_report_text(period_min, end_ts, ctx))
+    if not ctx["rows"]:
+        return
+    csv_bytes = build_report_csv(period_min, end_ts, ctx)
+    ts_label = datetime.fromtimestamp(end_ts, tz=timezone.utc).strftime("%Y%m%d-%H%M%S")
+    send_document(f"trades_{period_min}m_until_{ts_label}.csv", csv_bytes, caption="CSV сделок за отчётный период")
+
 def _build_and_send(period_min: int, end_ts: int) -> None:
     """
     Фактическая сборка + отправка отчёта (в фоне).
     Никаких исключений наружу не выбрасываем.
     """
     try:
-        text = build_report_text(period_min, end_ts)
-        csv_bytes = build_report_csv(period_min, end_ts)
-        send_event("report", text)
-        ts_label = datetime.fromtimestamp(end_ts, tz=timezone.utc).strftime("%Y%m%d-%H%M%S")
-        send_document(f"trades_{period_min}m_until_{ts_label}.csv", csv_bytes, caption="CSV сделок за отчётный период")
+        _send_report_for(period_min, end_ts)
     except Exception:
         # тихо гасим любые ошибки, чтобы не мешать торговле
         pass
@@ -518,7 +509,7 @@ def _schedule_background_report(period_min: int, end_ts: int) -> None:
     ВАЖНО: помечаем период как «отправленный» СРАЗУ, чтобы исключить дублирование.
     """
     _set_last_period_end_ts(end_ts)
-    _BG_EXEC.submit(_build_and_send, period_min, end_ts)
+    _get_bg_exec().submit(_build_and_send, period_min, end_ts)
 
 def send_report(force: bool = False) -> bool:
     """
@@ -537,28 +528,33 @@ def send_report(force: bool = False) -> bool:
         if _get_last_period_end_ts() == last_completed_end:
             return False
 
-    text = build_report_text(period_min, last_completed_end)
-    csv_bytes = build_report_csv(period_min, last_completed_end)
-    send_event("report", text)
-    ts_label = datetime.fromtimestamp(last_completed_end, tz=timezone.utc).strftime("%Y%m%d-%H%M%S")
-    send_document(f"trades_{period_min}m_until_{ts_label}.csv", csv_bytes, caption="CSV сделок за отчётный период")
+    _send_report_for(period_min, last_completed_end)
     _set_last_period_end_ts(last_completed_end)
     return True
 
+# (period_min, unix-время начала следующего «окна» первой минуты): до него tick() ничего не считает
+_NEXT_FIRE: Tuple[int, int] | None = None
+
 def tick():
     """
     НЕ блокирует торговлю. Если настало «окно» первой минуты — планирует отчёт
     в фоне и сразу возвращается.
     """
+    global _NEXT_FIRE
     try:
         enabled, period_min = get_settings()
         if not enabled:
             return
         now = int(time.time())
+        nf = _NEXT_FIRE
+        if nf is not None and nf[0] == period_min and now < nf[1]:
+            return
         end_ts = _align_period_end(now, period_min)
         if _is_first_minute_after(end_ts, now):
             with _BG_LOCK:
                 if _get_last_period_end_ts() != end_ts:
                     _schedule_background_report(period_min, end_ts)
+        # следующее окно — первая минута после конца текущего (ещё идущего) периода
+        _NEXT_FIRE = (period_min, end_ts + 1 + period_min * 60)
     except Exception:
         pass
@@ -15,7 +15,7 @@ from core.quant import dquant, fmt
 from core.drain import drain_base_position
 from core.sync import sleep_until_next_minute
 from core.state import set_last_order_id, get_last_order_id
-from core.params import list_pairs, get_paused, get_shutdown, set_shutdown
+from core.params import list_pairs, get_paused, get_shutdown, set_shutdown, optimize_tick as db_optimize_tick
 from core.reporting import tick as reporting_tick
 from core.heartbeat import tick as heartbeat_tick, init as heartbeat_init
 from core.telemetry import send_event
@@ -356,6 +356,7 @@ def trading_cycle():
                 sleep_until_next_minute()
                 reporting_tick()
                 heartbeat_tick()
+                db_optimize_tick()
                 continue
 
             pairs_all = list_pairs(include_disabled=True)
@@ -384,6 +385,7 @@ def trading_cycle():
                 sleep_until_next_minute()
                 reporting_tick()
                 heartbeat_tick()
+                db_optimize_tick()
                 continue
 
             max_workers = min(16, max(1, len(pairs) * 2))
@@ -414,6 +416,7 @@ def trading_cycle():
 
             reporting_tick()
             heartbeat_tick()
+            db_optimize_tick()
 
         except Exception as e:
             print(f"Ошибка цикла: {e}")
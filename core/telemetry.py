@@ -12,6 +12,9 @@ TG_THREAD = os.getenv("TELEGRAM_THREAD_ID", "").strip() or None
 APP_NAME  = os.getenv("APP_NAME", "").strip() or os.getenv("HEROKU_APP_NAME", "").strip() or "TradingBot"
 ENV_NAME  = os.getenv("ENV", "").strip() or ("heroku" if os.getenv("DYNO") else "local")
 
+# Keep-alive к api.telegram.org: отчёт = сообщение + документ, без нового TLS-рукопожатия на каждый
+_SESSION = requests.Session()
+
 def _tg_send(text: str, parse_mode: Optional[str] = "HTML") -> bool:
     if not TELEMETRY_ENABLED or not TG_TOKEN or not TG_CHAT:
         return False
@@ -22,7 +25,7 @@ def _tg_send(text: str, parse_mode: Optional[str] = "HTML") -> bool:
             payload["parse_mode"] = parse_mode
         if TG_THREAD:
             payload["message_thread_id"] = int(TG_THREAD)
-        r = requests.post(url, json=payload, timeout=15)
+        r = _SESSION.post(url, json=payload, timeout=15)
         return 200 <= r.status_code < 300
     except Exception:
         return False
@@ -39,7 +42,7 @@ def _tg_send_document(filename: str, data: bytes, caption: Optional[str] = None)
             data_form["parse_mode"] = "HTML"
         if TG_THREAD:
             data_form["message_thread_id"] = int(TG_THREAD)
-        r = requests.post(url, data=data_form, files=files, timeout=30)
+        r = _SESSION.post(url, data=data_form, files=files, timeout=30)
         return 200 <= r.status_code < 300
     except Exception:
         return False
@@ -238,22 +238,23 @@ def fetch_trades(
     lo = start_ts or 0
     hi = end_ts or 9_999_999_999
 
+    # строки list_my_trades уже нормализованы (str/int) — повторно не приводим
     for t in raw:
-        ts = int(t.get("create_time", 0))
+        ts = t["create_time"]
         if ts < lo or ts > hi:
             continue
         out.append({
             "ts": ts,
-            "price": str(t.get("price", "0")),
-            "amount": str(t.get("amount", "0")),
-            "side": str(t.get("side", "")).lower(),
-            "fee": str(t.get("fee", "0")),
-            "fee_currency": str(t.get("fee_currency", "USDT")),
-            "trade_id": str(t.get("id", "")),
+            "price": t["price"],
+            "amount": t["amount"],
+            "side": t["side"],
+            "fee": t["fee"],
+            "fee_currency": t["fee_currency"],
+            "trade_id": t["id"],
         })
 
     # Стабильная сортировка и усечение по limit (если задан)
-    out.sort(key=lambda r: (int(r.get("ts", 0)), str(r.get("trade_id", ""))))
+    out.sort(key=lambda r: (r["ts"], r["trade_id"]))
     if limit is not None and limit > 0:
         out = out[:limit]
     return out
@@ -0,0 +1,30 @@
+# tests/conftest.py
+import os
+import queue
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.pop("DATABASE_URL", None)
+os.environ.setdefault("TELEMETRY_ENABLED", "false")
+
+
+@pytest.fixture
+def params(tmp_path, monkeypatch):
+    """core.params на чистой SQLite-базе во временном каталоге (схема + миграции)."""
+    from core import db
+    monkeypatch.setattr(db, "_USE_PG", False)
+    monkeypatch.setattr(db, "_SQLITE_PATH", str(tmp_path / "bot.db"))
+    monkeypatch.setattr(db, "_sqlite_conn", None)
+    monkeypatch.setattr(db, "_sqlite_pools", {False: queue.LifoQueue(), True: queue.LifoQueue()})
+    monkeypatch.setattr(db, "_sqlite_pool_sizes", {False: 0, True: 0})
+
+    from core import params as P
+    from core.db_migrate import run_all
+    monkeypatch.setattr(P, "_SCHEMA_MIGRATED", False)
+    monkeypatch.setattr(P, "_RUNTIME_CACHE", {})
+    monkeypatch.setattr(P, "_active_count_cache", None)
+    P.ensure_schema()
+    run_all()
+    return P
@@ -0,0 +1,155 @@
+# tests/test_params_pairs.py
+import sqlite3
+from decimal import Decimal
+
+from core import db
+
+
+def _pair(pair, exchange="gate", **kw):
+    p = {"pair": pair, "exchange": exchange, "deviation_pct": "0.5", "quote": "10",
+         "lot_size_base": "0", "gap_mode": "off", "gap_switch_pct": "1", "enabled": True}
+    p.update(kw)
+    return p
+
+
+def _slots(P):
+    return [(p["idx"], p["exchange"], p["pair"]) for p in P.list_pairs(True)]
+
+
+def _raw():
+    return sqlite3.connect(db._SQLITE_PATH, isolation_level=None)
+
+
+def test_upsert_grow_reorder_shrink(params):
+    P = params
+    P.upsert_pairs([_pair("A_USDT"), _pair("B_USDT", "htx"), _pair("C_USDT")])
+    assert _slots(P) == [(1, "gate", "A_USDT"), (2, "htx", "B_USDT"), (3, "gate", "C_USDT")]
+
+    # перестановка: пары переезжают между слотами, уникальность по pair не мешает
+    saved = P.upsert_pairs([_pair("C_USDT"), _pair("A_USDT"), _pair("B_USDT", "htx")])
+    assert [(p["idx"], p["pair"]) for p in saved] == [(1, "C_USDT"), (2, "A_USDT"), (3, "B_USDT")]
+    assert _slots(P) == [(1, "gate", "C_USDT"), (2, "gate", "A_USDT"), (3, "htx", "B_USDT")]
+
+    # сжатие: лишние слоты удаляются
+    P.upsert_pairs([_pair("B_USDT", "htx")])
+    assert _slots(P) == [(1, "htx", "B_USDT")]
+
+    # рост
+    P.upsert_pairs([_pair("B_USDT", "htx"), _pair("D_USDT"), _pair("E_USDT", enabled=False)])
+    assert _slots(P) == [(1, "htx", "B_USDT"), (2, "gate", "D_USDT"), (3, "gate", "E_USDT")]
+    assert [p["pair"] for p in P.list_pairs(False)] == ["B_USDT", "D_USDT"]
+    assert P.active_pair_count() == 2
+
+    with _raw() as c:
+        assert c.execute("SELECT idx, pair FROM bot_pairs ORDER BY idx").fetchall() == \
+            [(1, "B_USDT"), (2, "D_USDT"), (3, "E_USDT")]
+
+
+def test_upsert_returns_db_values(params):
+    P = params
+    saved = P.upsert_pairs([_pair("A_USDT", quote="3.0")])
+    assert saved == P.list_pairs(True)
+    # копии: правка результата не портит кэш
+    saved[0]["pair"] = "X_USDT"
+    assert P.list_pairs(True)[0]["pair"] == "A_USDT"
+
+
+def test_delete_pair_resequences(params):
+    P = params
+    P.upsert_pairs([_pair("A_USDT"), _pair("B_USDT", "htx"), _pair("C_USDT"), _pair("D_USDT")])
+    assert P.active_pair_count() == 4
+
+    assert P.delete_pair("htx", "B_USDT") is True
+    assert _slots(P) == [(1, "gate", "A_USDT"), (2, "gate", "C_USDT"), (3, "gate", "D_USDT")]
+    assert P.active_pair_count() == 3
+
+    # биржа учитывается: та же пара на другой бирже не удаляется
+    assert P.delete_pair("htx", "C_USDT") is False
+    assert P.delete_pair("GATE", "A_USDT") is True
+    assert _slots(P) == [(1, "gate", "C_USDT"), (2, "gate", "D_USDT")]
+
+
+def test_resequence_fallback_without_update_from(params, monkeypatch):
+    P = params
+    monkeypatch.setattr(P, "_SQLITE_HAS_UPDATE_FROM", False)
+    P.upsert_pairs([_pair("A_USDT"), _pair("B_USDT"), _pair("C_USDT")])
+    assert P.delete_pair("gate", "A_USDT") is True
+    assert _slots(P) == [(1, "gate", "B_USDT"), (2, "gate", "C_USDT")]
+
+
+def test_pairs_cache_sees_other_process_after_ttl(params, monkeypatch):
+    P = params
+    P.upsert_pairs([_pair("A_USDT")])
+    assert _slots(P) == [(1, "gate", "A_USDT")]
+    with _raw() as c:
+        c.execute("UPDATE bot_pairs SET pair='Z_USDT' WHERE idx=1")
+    # в пределах TTL — кэш; после — свежие данные
+    assert _slots(P) == [(1, "gate", "A_USDT")]
+    monkeypatch.setattr(P, "_PAIRS_TTL", 0.0)
+    assert _slots(P) == [(1, "gate", "Z_USDT")]
+
+
+def test_run_all_invalidates_column_cache_when_current(params):
+    P = params
+    conn = db.get_conn()
+    # соседний процесс уже мигрировал, а этот успел закэшировать старую схему в ensure_schema()
+    P._TABLE_COLS_CACHE[(True, "bot_pairs")] = frozenset({"idx", "pair"})
+    from core.db_migrate import run_all
+    run_all()
+    assert P._has_column(conn, "bot_pairs", "exchange")
+
+
+def test_missing_column_not_cached_before_migrations(params, monkeypatch):
+    P = params
+    monkeypatch.setattr(P, "_SCHEMA_MIGRATED", False)
+    P.invalidate_schema_cache()
+    conn = db.get_conn()
+    assert not P._has_column(conn, "bot_pairs", "extra")
+    with _raw() as c:
+        c.execute("ALTER TABLE bot_pairs ADD COLUMN extra TEXT")
+    assert P._has_column(conn, "bot_pairs", "extra")
+
+
+def test_runtime_flags_written_synchronously(params):
+    P = params
+    P.set_paused(True)
+    P.set_shutdown(True)
+    with _raw() as c:
+        rows = dict(c.execute("SELECT key, value FROM bot_runtime WHERE key IN ('paused','shutdown')").fetchall())
+    assert rows == {"paused": "true", "shutdown": "true"}
+    assert P.get_paused() and P.get_shutdown()
+    P.set_paused(False)
+    assert not P.get_paused()
+
+
+def test_pair_numerics_round_trip(params):
+    P = params
+    written = {"deviation_pct": "0.12345678901234568", "quote": "0.0000001",
+               "lot_size_base": "2.5", "gap_switch_pct": "3"}
+    saved = P.upsert_pairs([_pair("A_USDT", **written)])
+    P._store_pairs(None)
+    for got in (saved[0], P.list_pairs(True)[0]):
+        for k, v in written.items():
+            assert str(got[k]) == str(P._PAIR_CTX.create_decimal(v)), k
+
+
+def test_pair_numerics_accept_padded_strings(params):
+    P = params
+    saved = P.upsert_pairs([_pair("A_USDT", deviation_pct=" 0.5", quote="10\n", lot_size_base="1_000",
+                                  gap_switch_pct=2.5)])
+    got = saved[0]
+    assert (got["deviation_pct"], got["quote"], got["lot_size_base"], got["gap_switch_pct"]) == \
+        (Decimal("0.5"), Decimal("10"), Decimal("1000"), Decimal("2.5"))
+
+
+def test_build_pairs_converts_every_row(params):
+    P = params
+    rows = iter([
+        (1, "A_USDT", Decimal("0.5"), Decimal("10"), Decimal("0"), "off", Decimal("1"), 1, "gate"),
+        (2, "B_USDT", None, "7.25", 3, "off", 0.5, 1, "htx"),
+    ])
+    a, b = P._build_pairs(rows)
+    assert a["deviation_pct"] == Decimal("0.5")
+    assert (b["deviation_pct"], b["quote"], b["lot_size_base"], b["gap_switch_pct"]) == \
+        (Decimal("0"), Decimal("7.25"), Decimal("3"), Decimal("0.5"))
+    assert all(type(b[k]) is Decimal for k in ("deviation_pct", "quote", "lot_size_base", "gap_switch_pct"))
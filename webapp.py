@@ -11,7 +11,7 @@ from core import exchange_proxy
 import config as CONF
 
 from core.params import (
-    load_overrides, upsert_params, get_paused, set_paused, ensure_schema,
+    load_overrides, load_state, upsert_params, get_paused, set_paused, ensure_schema,
     list_pairs, upsert_pairs,
 )
 from core.params import delete_pair as _delete_pair  # ← для удаления строки из БД
@@ -30,7 +30,7 @@ from config import ADMIN_TOKEN as CONF_ADMIN_TOKEN
 from core.db_migrate import run_all as run_db_migrations
 
 from core.exchange_proxy import available_exchanges
-from core.heartbeat import get_last_ping_ts
+from core.heartbeat import get_last_ping_ts, FAST_PING_ALIVE_SEC
 
 app = FastAPI(title="CEX Trading Bot API", version="2.6.0")
 
@@ -180,7 +180,8 @@ def root():
 
 @app.get("/status", dependencies=[Depends(require_admin)])
 def status():
-    p = load_overrides()
+    # paused/shutdown/параметры — одним запросом
+    paused, shutdown, p = load_state()
     rep_enabled, rep_period = get_report_settings()
     pairs_view = [_pair_to_view(x) for x in list_pairs(include_disabled=True)]
 
@@ -188,12 +189,12 @@ def status():
     now = int(time.time())
     last_ping = get_last_ping_ts() or 0
     ping_age = now - last_ping if last_ping > 0 else 10**9
-    alive = ping_age <= 15  # 3 * 5 сек (можете сделать настраиваемым)
+    alive = ping_age <= FAST_PING_ALIVE_SEC  # с учётом задержки сброса fast-ping в БД
 
     return {
         "status": "ok",
-        "paused": get_paused(),
-        "shutdown": get_shutdown(),
+        "paused": paused,
+        "shutdown": shutdown,
         "alive": alive,
         "last_ping_age_sec": ping_age,
         "params": {k: str(v) for k, v in p.items()},